@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from .models import Order, OrderItem, OrderEvent, ArchivedOrder, ArchivedOrderItem
+
+ARCHIVE_BATCH_SIZE = 1000
+ORDER_FIELDS = ['id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date', 'item_count', 'item_titles']
+ORDER_ITEM_FIELDS = ['order_id', 'menuitem_id', 'quantity', 'price']
+
+
+def archivable_orders(days):
+    # Delivered orders older than `days`. Orders still in the change feed
+    # stay until prune_order_events has dropped their events, so clients
+    # following the feed never lose track of them.
+    cutoff = date.today() - timedelta(days=days)
+    return Order.objects.filter(status=True, date__lt=cutoff).filter(
+        ~Exists(OrderEvent.objects.filter(order=OuterRef('pk'))))
+
+
+def archive_batch(days, batch_size=ARCHIVE_BATCH_SIZE):
+    # Copy one batch of orders and their items to the archive tables and
+    # delete them from the hot ones in a single transaction. Rows locked by
+    # concurrent updates are left for the next run. Returns the batch size.
+    with transaction.atomic():
+        ids = list(
+            archivable_orders(days).order_by('id').select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(**row) for row in Order.objects.filter(id__in=ids).values(*ORDER_FIELDS)
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**row) for row in OrderItem.objects.filter(order_id__in=ids).values(*ORDER_ITEM_FIELDS)
+        ])
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive_orders(days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    # Archive in batches until nothing is left, returns the number of orders.
+    # The reporting rollups are left as they are, they already count these orders.
+    days = settings.ORDER_ARCHIVE_AFTER_DAYS if days is None else days
+    archived = 0
+    while batch := archive_batch(days, batch_size):
+        archived += batch
+    return archived
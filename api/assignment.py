@@ -0,0 +1,44 @@
+from django.db import transaction
+from .models import Order
+from .changes import record_order_events, UPDATED
+from .reports import record_deliveries
+
+UPDATED_RESULT = 'updated'
+UNCHANGED_RESULT = 'unchanged'
+NOT_FOUND_RESULT = 'not_found'
+MAX_BATCH_ORDERS = 500
+
+
+def update_orders(orders, order_ids, **changes):
+    # Set delivery_crew_id and/or status on the given orders of the
+    # `orders` queryset with one locking read and one UPDATE, keeping the
+    # change feed and delivery rollups in step. Returns a result per id.
+    with transaction.atomic():
+        current = {
+            row['id']: row for row in orders.select_for_update().filter(id__in=order_ids)
+            .values('id', 'user_id', 'delivery_crew_id', 'status', 'date')
+        }
+        changed = [
+            Order(**{**row, **changes}) for row in current.values()
+            if any(row[field] != value for field, value in changes.items())
+        ]
+        previous = {order.id: current[order.id] for order in changed}
+        if changed:
+            Order.objects.filter(id__in=list(previous)).update(**changes)
+            record_order_events(changed, UPDATED, {
+                order_id: row['delivery_crew_id'] for order_id, row in previous.items()})
+            record_deliveries([
+                (order, previous[order.id]['status'], previous[order.id]['delivery_crew_id'])
+                for order in changed
+            ])
+
+    results = []
+    for order_id in dict.fromkeys(order_ids):
+        if order_id not in current:
+            result = NOT_FOUND_RESULT
+        elif order_id in previous:
+            result = UPDATED_RESULT
+        else:
+            result = UNCHANGED_RESULT
+        results.append({'id': order_id, 'result': result})
+    return results
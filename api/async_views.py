@@ -0,0 +1,129 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound
+from . import views
+from .catalog import acached_catalog_response
+from .models import MenuItemCount
+
+# Native async GET handlers for the read-heavy endpoints. Authentication,
+# permissions, filtering and rendering are the DRF view's own; only the
+# queries run on the async ORM. Every other method is handed to the DRF view.
+
+
+async def apaginate(view, queryset):
+    # PageNumberPagination.paginate_queryset with an async count and fetch.
+    # The Django Paginator only sees a range, so it never touches the db.
+    paginator = view.paginator
+    request = view.request
+    page_size = paginator.get_page_size(request)
+    page_number = request.query_params.get(paginator.page_query_param) or 1
+
+    django_paginator = Paginator(range(await queryset.acount()), page_size)
+    if page_number in paginator.last_page_strings:
+        page_number = django_paginator.num_pages
+    try:
+        page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+    paginator.page = page
+    paginator.request = request
+    paginator.keyset = False
+    if paginator.template is not None and page.paginator.num_pages > 1:
+        paginator.display_page_controls = True
+    if not page.object_list:
+        return []
+    return [obj async for obj in queryset[page.object_list.start:page.object_list.stop]]
+
+
+class AsyncAPIView(View):
+    # Concrete views name the DRF view they serve in view_class and answer
+    # its GETs in aget(view, request)
+    view_class = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.view_class is not None and not hasattr(cls, 'aget'):
+            raise TypeError(f'{cls.__name__} sets view_class but does not define aget')
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Authentication classes enforce CSRF themselves, as in APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method.lower() != 'get':
+            return await sync_to_async(self.view_class.as_view())(request, *args, **kwargs)
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        view = self.view_class()
+        view.args, view.kwargs = args, kwargs
+        view.request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        try:
+            await sync_to_async(view.initial)(view.request, *args, **kwargs)
+            response = await self.aget(view, view.request)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return view.finalize_response(view.request, response, *args, **kwargs)
+
+
+class AsyncListView(AsyncAPIView):
+    async def alist(self, view, request):
+        if 'cursor' in request.query_params:
+            return await sync_to_async(view.list)(request)
+        if getattr(view, 'fast_rows_class', None) and view.use_fast_path():
+            queryset = await sync_to_async(view.fast_queryset)()
+            rows = await apaginate(view, queryset)
+            return view.get_paginated_response(await sync_to_async(view.fast_data)(rows))
+        queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+        rows = await apaginate(view, queryset)
+        return view.get_paginated_response(view.get_serializer(rows, many=True).data)
+
+    async def aget(self, view, request):
+        return await self.alist(view, request)
+
+
+class AsyncCatalogListView(AsyncListView):
+    async def aget(self, view, request):
+        return await acached_catalog_response(request, lambda: self.alist(view, request))
+
+
+class MenuItemsView(AsyncCatalogListView):
+    view_class = views.MenuItemsView
+
+
+class CategoriesView(AsyncCatalogListView):
+    view_class = views.CategoriesView
+
+
+class OrderView(AsyncListView):
+    view_class = views.OrderView
+
+    async def alist(self, view, request):
+        if view.include_archived():
+            return await sync_to_async(view.list)(request)
+        return await super().alist(view, request)
+
+
+class MenuItemCountsView(AsyncAPIView):
+    view_class = views.total_menu_items.cls
+
+    async def acounts(self, request):
+        page_size = views.get_counts_page_size(request)
+        search_slug = request.query_params.get('category')
+        if search_slug is not None:
+            menuitem_count = await MenuItemCount.objects.filter(
+                category__slug=search_slug).values_list('count', flat=True).afirst() or 0
+            return views.counts_response(menuitem_count, page_size)
+        categories = [category async for category in views.category_counts()]
+        return views.counts_response(sum(category["counts"] for category in categories), page_size, categories)
+
+    async def aget(self, view, request):
+        return await acached_catalog_response(request, lambda: self.acounts(request))
+
+
+total_menu_items = MenuItemCountsView.as_view()
@@ -0,0 +1,99 @@
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication as SimpleJWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .middleware import route_name
+
+
+# Revocations live in their own cache alias, shared by every worker and
+# never culled, see CACHES in the settings
+REVOCATION_CACHE = 'revocation'
+
+
+def revocation_cache():
+    return caches[REVOCATION_CACHE]
+
+
+def stateless_enabled():
+    # A per-process cache that culls entries can't be trusted with
+    # revocations, the database user is loaded instead
+    return bool(settings.STATELESS_JWT_ROUTES) and not isinstance(revocation_cache(), LocMemCache)
+
+
+@checks.register(checks.Tags.security)
+def check_revocation_cache(app_configs, **kwargs):
+    if settings.STATELESS_JWT_ROUTES and isinstance(revocation_cache(), LocMemCache):
+        return [checks.Warning(
+            'STATELESS_JWT_ROUTES is ignored while the revocation cache is local memory',
+            hint='Point CACHES["revocation"] at a shared cache such as Redis (REDIS_URL).',
+            id='api.W001',
+        )]
+    return []
+
+
+def revoked_key(jti):
+    return f'jwt:revoked:{jti}'
+
+
+def revoked_before_key(user_id):
+    return f'jwt:revoked-before:{user_id}'
+
+
+def revoke_token(token):
+    # Kept until the token would have expired anyway
+    revocation_cache().set(revoked_key(token['jti']), True, max(1, int(token['exp'] - time.time())))
+
+
+def revoke_user_tokens(user_id):
+    # Every token from a login before this second, refreshed ones included
+    # since they carry the auth_time of the login. iat and auth_time are
+    # whole seconds, so a token issued in the same second is kept.
+    revocation_cache().set(revoked_before_key(user_id), int(time.time()), int(jwt_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+
+
+def is_revoked(token):
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    keys = [revoked_key(token.get('jti')), revoked_before_key(user_id)]
+    values = revocation_cache().get_many(keys)
+    if values.get(keys[0]):
+        return True
+    revoked_before = values.get(keys[1])
+    issued = token.get('auth_time', token.get('iat'))
+    return revoked_before is not None and (issued is None or int(issued) < revoked_before)
+
+
+def token_user(token):
+    # An unsaved User carrying only the claims, usable in queries and as a
+    # foreign key value. Never save it.
+    user = User(id=token[jwt_settings.USER_ID_CLAIM], username=token.get('username', ''))
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+class JWTAuthentication(SimpleJWTAuthentication):
+    # simplejwt's authentication plus a revocation check served from the
+    # cache. On the routes in STATELESS_JWT_ROUTES the user is built from the
+    # token claims instead of being loaded from the database, as long as
+    # the revocation cache is shared.
+    def authenticate(self, request):
+        self.stateless = route_name(request) in settings.STATELESS_JWT_ROUTES and stateless_enabled()
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return token
+
+    def get_user(self, validated_token):
+        if not self.stateless:
+            return super().get_user(validated_token)
+        if jwt_settings.USER_ID_CLAIM not in validated_token:
+            raise AuthenticationFailed('Token contained no recognizable user identification', code='token_not_valid')
+        return token_user(validated_token)
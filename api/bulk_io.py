@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+from itertools import groupby, islice
+from operator import itemgetter
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework import serializers
+from .models import Category, MenuItem, OrderItem, ArchivedOrderItem
+from .catalog import bump_catalog_version
+from .counters import rebuild_menu_item_counts
+
+MENU_ITEM_FIELDS = ['title', 'price', 'featured', 'category', 'description']
+ORDER_FIELDS = ['order', 'user', 'delivery_crew', 'status', 'date', 'total']
+ORDER_ITEM_FIELDS = ['menuitem', 'title', 'quantity', 'price']
+ORDER_EXPORT_COLUMNS = {
+    'order': 'order_id', 'user': 'order__user_id', 'delivery_crew': 'order__delivery_crew_id',
+    'status': 'order__status', 'date': 'order__date', 'total': 'order__total',
+    'menuitem': 'menuitem_id', 'title': 'menuitem__title', 'quantity': 'quantity', 'price': 'price',
+}
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+
+
+class MenuItemRowSerializer(serializers.Serializer):
+    # Validates an import row without touching the db, category is a slug
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2)
+    featured = serializers.BooleanField(default=False)
+    category = serializers.SlugField(max_length=255)
+    category_title = serializers.CharField(max_length=255, required=False)
+    description = serializers.CharField(allow_blank=True, allow_null=True, required=False, default=None)
+
+
+def file_format(name, default='csv'):
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, format):
+    # Yield (line number, row dict) pairs from a text stream, one at a time
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError:
+                    yield line_num, None
+    else:
+        raise ValueError(f'Unknown format {format}')
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def resolve_categories(rows, category_ids):
+    # Look up every slug of the chunk in one query and create the missing
+    # ones. A slug whose title is taken by another category stays unresolved.
+    missing = {row['category']: row.get('category_title') or row['category']
+               for row in rows if row['category'] not in category_ids}
+    if not missing:
+        return
+    category_ids.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+    new = [Category(slug=slug, title=title) for slug, title in missing.items() if slug not in category_ids]
+    if new:
+        Category.objects.bulk_create(new, ignore_conflicts=True)
+        category_ids.update(Category.objects.filter(slug__in=[c.slug for c in new]).values_list('slug', 'id'))
+
+
+def import_menu_items(stream, format, chunk_size=IMPORT_CHUNK_SIZE):
+    # Upsert menu items by title from a CSV/JSONL stream in chunked
+    # transactions. Only the current chunk is held in memory.
+    report = {'created': 0, 'updated': 0, 'errors': [], 'error_count': 0}
+    category_ids = {}
+
+    def error(line_num, errors):
+        report['error_count'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_num, 'errors': errors})
+
+    try:
+        for chunk in chunks(read_rows(stream, format), chunk_size):
+            rows = {}
+            for line_num, data in chunk:
+                row = MenuItemRowSerializer(data=data if isinstance(data, dict) else {})
+                if data is None or not row.is_valid():
+                    error(line_num, row.errors if data is not None else 'Invalid JSON')
+                    continue
+                rows[row.validated_data['title']] = (line_num, row.validated_data)
+
+            with transaction.atomic():
+                resolve_categories([row for _, row in rows.values()], category_ids)
+                existing = MenuItem.objects.in_bulk(list(rows), field_name='title')
+                new, changed = [], []
+                for title, (line_num, row) in rows.items():
+                    if row['category'] not in category_ids:
+                        error(line_num, {'category': [f'Category title of "{row["category"]}" is already used by another category']})
+                        continue
+                    item = existing.get(title) or MenuItem(title=title)
+                    item.price = row['price']
+                    item.featured = row['featured']
+                    item.category_id = category_ids[row['category']]
+                    item.description = row['description']
+                    (changed if item.pk else new).append(item)
+                MenuItem.objects.bulk_create(new)
+                MenuItem.objects.bulk_update(changed, ['price', 'featured', 'category', 'description'])
+            report['created'] += len(new)
+            report['updated'] += len(changed)
+    finally:
+        # bulk writes skip the model signals. Committed chunks stay when a
+        # later one fails, so this runs either way.
+        rebuild_menu_item_counts()
+        transaction.on_commit(bump_catalog_version)
+    return report
+
+
+def export_rows():
+    return (
+        MenuItem.objects.order_by('id')
+        .values('title', 'price', 'featured', 'category__slug', 'description')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+
+def csv_lines(rows, fields, rename=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(fields)
+    for row in rows:
+        yield line([row[(rename or {}).get(field, field)] for field in fields])
+
+
+def jsonl_lines(rows, fields, rename=None):
+    for row in rows:
+        yield json.dumps({field: row[(rename or {}).get(field, field)] for field in fields}, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_menu_items(format):
+    lines = csv_lines if format == 'csv' else jsonl_lines
+    return lines(export_rows(), MENU_ITEM_FIELDS, rename={'category': 'category__slug'})
+
+
+def order_export_rows(start=None, end=None, status=None, delivery_crew=None, include_archived=False):
+    # One row per order item, joined with its order and read through a
+    # server-side cursor. Items of an order come out next to each other,
+    # archived orders after the hot ones.
+    models = [OrderItem, ArchivedOrderItem] if include_archived else [OrderItem]
+    for model in models:
+        queryset = model.objects.all()
+        if start is not None:
+            queryset = queryset.filter(order__date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(order__date__lte=end)
+        if status is not None:
+            queryset = queryset.filter(order__status=status)
+        if delivery_crew is not None:
+            queryset = queryset.filter(order__delivery_crew_id=delivery_crew)
+        yield from (
+            queryset.order_by('order_id', 'id')
+            .values(*ORDER_EXPORT_COLUMNS.values())
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+
+
+def order_jsonl_lines(rows):
+    # One line per order with its items nested, only one order is held at a time
+    for _, items in groupby(rows, key=itemgetter('order_id')):
+        items = list(items)
+        order = {field: items[0][ORDER_EXPORT_COLUMNS[field]] for field in ORDER_FIELDS}
+        order['items'] = [{field: item[ORDER_EXPORT_COLUMNS[field]] for field in ORDER_ITEM_FIELDS} for item in items]
+        yield json.dumps(order, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_orders(format, **filters):
+    rows = order_export_rows(**filters)
+    if format == 'csv':
+        return csv_lines(rows, ORDER_FIELDS + ORDER_ITEM_FIELDS, rename=ORDER_EXPORT_COLUMNS)
+    return order_jsonl_lines(rows)
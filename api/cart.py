@@ -0,0 +1,23 @@
+from django.db import connection, transaction
+from .models import Cart
+
+
+def update_cart(user, upsert, remove):
+    # Upsert validated lines on the (menuitem, user) key and drop removed
+    # menu items in one transaction
+    lines = [
+        Cart(user=user, menuitem_id=line['menuitem'], quantity=line['quantity'],
+             unit_price=line['unit_price'], price=line['price'])
+        for line in upsert
+    ]
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['menuitem', 'user']
+
+    with transaction.atomic():
+        if lines:
+            Cart.objects.bulk_create(
+                lines, update_conflicts=True, unique_fields=unique_fields,
+                update_fields=['quantity', 'unit_price', 'price'])
+        if remove:
+            Cart.objects.filter(user=user, menuitem_id__in=remove).delete()
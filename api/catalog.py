@@ -0,0 +1,101 @@
+import time
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+from .routers import use_primary
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def get_catalog_version():
+    # Millisecond timestamp of the last menu/category change, so a version
+    # recreated after eviction still sorts after every version before it
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    version = max(int(time.time() * 1000), get_catalog_version() + 1)
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def is_fresh(version):
+    # Replicas may not have the change behind a version this recent yet, and
+    # whatever is built now is cached for the whole version
+    return bool(settings.DATABASE_REPLICAS) and (
+        time.time() * 1000 - version < settings.REPLICA_READ_YOUR_WRITES_SECONDS * 1000)
+
+
+def set_validators(response, version):
+    response['ETag'] = f'"{version}"'
+    response['Last-Modified'] = http_date(version // 1000)
+    return response
+
+
+def not_modified_response(request, version):
+    if get_conditional_response(request, etag=f'"{version}"', last_modified=version // 1000) is None:
+        return None
+    return set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), version)
+
+
+def cached_catalog_response(request, build):
+    # Serve a catalog GET from the cache entry of the current version, or
+    # build it with build() and store it. Clients holding the version get a 304.
+    version = get_catalog_version()
+    not_modified = not_modified_response(request, version)
+    if not_modified is not None:
+        return not_modified
+
+    key = f'catalog:{version}:{request.get_full_path()}'
+    data = cache.get(key)
+    if data is None:
+        if is_fresh(version):
+            with use_primary():
+                response = build()
+        else:
+            response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        data = response.data
+        cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+    return set_validators(Response(data), version)
+
+
+async def acached_catalog_response(request, abuild):
+    # cached_catalog_response for async views, abuild is a coroutine function
+    version = await sync_to_async(get_catalog_version)()
+    not_modified = not_modified_response(request, version)
+    if not_modified is not None:
+        return not_modified
+
+    key = f'catalog:{version}:{request.get_full_path()}'
+    data = await cache.aget(key)
+    if data is None:
+        if is_fresh(version):
+            with use_primary():
+                response = await abuild()
+        else:
+            response = await abuild()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        data = response.data
+        await cache.aset(key, data, CATALOG_CACHE_TIMEOUT)
+    return set_validators(Response(data), version)
+
+
+def catalog_cached(method):
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return cached_catalog_response(request, lambda: method(self, request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,65 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .models import OrderEvent
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNASSIGNED = 'unassigned'
+MAX_CHANGES = 500
+
+
+def record_order_events(orders, kind, previous_crew=None):
+    # One event per order, plus one for the crew member an order was taken
+    # from so it drops out of their feed. previous_crew maps order id to the
+    # delivery crew id before the change.
+    previous_crew = previous_crew or {}
+    events = []
+    for order in orders:
+        events.append(OrderEvent(
+            order_id=order.pk, user_id=order.user_id, delivery_crew_id=order.delivery_crew_id, kind=kind))
+        previous = previous_crew.get(order.pk)
+        if previous is not None and previous != order.delivery_crew_id:
+            events.append(OrderEvent(
+                order_id=order.pk, user_id=order.user_id, delivery_crew_id=previous, kind=UNASSIGNED))
+    OrderEvent.objects.bulk_create(events)
+
+
+def current_version():
+    return OrderEvent.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def is_pruned(since):
+    # Versions handed out are always ids of existing events, so a missing
+    # one means the client's cursor is older than the retained log
+    return since > 0 and not OrderEvent.objects.filter(id=since).exists()
+
+
+def changes_since(events, orders, since, limit):
+    # Orders touched by the visible events after `since`. Touched orders the
+    # caller can no longer see are reported as removed.
+    events = events.order_by()
+    after = list(events.filter(id__gt=since).order_by('id').values_list('id', 'order_id')[:limit])
+    order_ids = {order_id for _, order_id in after}
+    if since:
+        # Ids are taken at insert, not at commit, so an event below `since`
+        # may have become visible after the caller read past it. Orders with
+        # recent events are sent again, at worst twice.
+        cutoff = timezone.now() - timedelta(seconds=settings.ORDER_CHANGES_LOOKBACK_SECONDS)
+        order_ids.update(events.filter(id__lte=since, created__gte=cutoff).values_list('order_id', flat=True).distinct())
+    changed = list(orders.filter(id__in=order_ids).order_by('id')) if order_ids else []
+    return {
+        'version': after[-1][0] if after else since,
+        'has_more': len(after) == limit,
+        'orders': changed,
+        'removed': sorted(order_ids - {order.id for order in changed}),
+    }
+
+
+def prune_order_events(days):
+    # The newest event is always kept so the current version stays valid
+    newest = current_version()
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OrderEvent.objects.filter(created__lt=cutoff, id__lt=newest).delete()
+    return deleted
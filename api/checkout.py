@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models import Sum
+from .models import Cart, MenuItem, Order, OrderItem
+from .summaries import item_summary
+from .changes import record_order_events, CREATED
+from .reports import record_sale
+
+
+def checkout(user, **order_fields):
+    # Lock the cart rows, total them in the db, write the order with all its
+    # items and clear the cart in one transaction. Returns None for an empty cart.
+    with transaction.atomic():
+        cart = Cart.objects.filter(user=user)
+        items = list(cart.select_for_update().values_list('menuitem_id', 'quantity', 'price'))
+        if not items:
+            return None
+
+        total = cart.aggregate(total=Sum('price'))['total']
+        titles = dict(MenuItem.objects.filter(
+            pk__in=[menuitem_id for menuitem_id, _, _ in items]).values_list('id', 'title'))
+        summary = item_summary((titles[menuitem_id], quantity) for menuitem_id, quantity, _ in items)
+        order = Order.objects.create(user=user, total=total, **summary, **order_fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem_id=menuitem_id, quantity=quantity, price=price)
+            for menuitem_id, quantity, price in items
+        ])
+        record_order_events([order], CREATED)
+        record_sale(order, items)
+        cart.delete()
+    return order
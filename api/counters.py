@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Category, MenuItem, MenuItemCount
+
+
+def adjust_menu_item_count(category_id, delta):
+    updated = MenuItemCount.objects.filter(category_id=category_id).update(count=F('count') + delta)
+    if not updated:
+        # No counter yet for this category, start it from the real count
+        MenuItemCount.objects.get_or_create(
+            category_id=category_id,
+            defaults={'count': MenuItem.objects.filter(category_id=category_id).count()})
+
+
+def rebuild_menu_item_counts():
+    with transaction.atomic():
+        counts = dict(MenuItem.objects.order_by().values_list('category').annotate(n=Count('id')))
+        MenuItemCount.objects.all().delete()
+        MenuItemCount.objects.bulk_create([
+            MenuItemCount(category_id=category_id, count=counts.get(category_id, 0))
+            for category_id in Category.objects.values_list('id', flat=True)
+        ])
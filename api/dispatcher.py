@@ -0,0 +1,77 @@
+import heapq
+import time
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Q
+from .models import Order
+from . import metrics
+from .assignment import update_orders
+
+DISPATCH_BATCH_SIZE = 100
+
+
+def unassigned_orders():
+    return Order.objects.filter(delivery_crew__isnull=True, status=False)
+
+
+def crew_loads():
+    # Open (undelivered) orders per active delivery crew member
+    return dict(
+        User.objects.filter(groups__name='delivery_crew', is_active=True)
+        .annotate(open_orders=Count('delivery_crew', filter=Q(delivery_crew__status=False)))
+        .values_list('id', 'open_orders')
+    )
+
+
+def balance(order_ids, loads):
+    # Give each order to the least loaded crew member, lowest id on ties
+    heap = [(load, crew_id) for crew_id, load in loads.items()]
+    heapq.heapify(heap)
+    assignments = {}
+    for order_id in order_ids:
+        load, crew_id = heapq.heappop(heap)
+        assignments.setdefault(crew_id, []).append(order_id)
+        heapq.heappush(heap, (load + 1, crew_id))
+    return assignments
+
+
+def dispatch_batch(batch_size=DISPATCH_BATCH_SIZE):
+    # Assign the oldest unassigned orders in one transaction. Rows locked by
+    # another dispatcher are skipped, so several can run side by side.
+    # Returns the number of orders picked and the number assigned, which is
+    # lower when some were assigned elsewhere meanwhile.
+    start = time.perf_counter()
+    with transaction.atomic():
+        loads = crew_loads()
+        if not loads:
+            return 0, 0
+        order_ids = list(
+            unassigned_orders().order_by('date', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        assigned = 0
+        for crew_id, ids in balance(order_ids, loads).items():
+            # Filtered again in case an order was assigned by hand meanwhile
+            results = update_orders(unassigned_orders(), ids, delivery_crew_id=crew_id)
+            assigned += sum(1 for row in results if row['result'] == 'updated')
+    if order_ids:
+        metrics.dispatched_orders.inc(assigned)
+        metrics.dispatch_batch_duration.observe(time.perf_counter() - start)
+    return len(order_ids), assigned
+
+
+def dispatch(batch_size=DISPATCH_BATCH_SIZE, max_batches=None):
+    # Dispatch batches until no unassigned orders are left
+    report = {'batches': 0, 'orders': 0}
+    start = time.perf_counter()
+    while max_batches is None or report['batches'] < max_batches:
+        picked, assigned = dispatch_batch(batch_size)
+        if not picked:
+            break
+        report['batches'] += 1
+        report['orders'] += assigned
+    elapsed = time.perf_counter() - start
+    report['seconds'] = round(elapsed, 3)
+    report['orders_per_second'] = round(report['orders'] / elapsed, 1) if elapsed else 0
+    return report
@@ -0,0 +1,132 @@
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .models import OrderItem, ArchivedOrderItem
+from .metrics import time_serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Read-only list rows built straight from values() projections, in exactly
+# the shape MenuItemSerializer and OrderSerializer produce. Used by the list
+# views when settings.FAST_LIST_RENDERING is on.
+
+price_field = serializers.DecimalField(max_digits=6, decimal_places=2)
+
+
+class MenuItemRows:
+    values = ['id', 'title', 'price', 'category', 'featured', 'category__title', 'description']
+
+    def build(self, rows):
+        price = price_field.to_representation
+        return [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'price': price(row['price']),
+                'category': row['category'],
+                'featured': row['featured'],
+                'category_name': row['category__title'],
+                'description': row['description'],
+            }
+            for row in rows
+        ]
+
+
+class OrderRows:
+    values = ['id', 'user', 'delivery_crew', 'delivery_crew__username', 'status', 'date', 'total']
+    item_models = [OrderItem]
+
+    def build(self, rows):
+        price = price_field.to_representation
+        items = {}
+        for model in self.item_models if rows else []:
+            lines = (
+                model.objects.filter(order_id__in=[row['id'] for row in rows]).order_by('id')
+                .values_list('order_id', 'menuitem_id', 'quantity', 'price')
+            )
+            for order_id, menuitem_id, quantity, line_price in lines:
+                items.setdefault(order_id, []).append(
+                    {'order': order_id, 'menuitem': menuitem_id, 'quantity': quantity, 'price': price(line_price)})
+        return [
+            {
+                'id': row['id'],
+                'user': row['user'],
+                'delivery_crew': (
+                    {'id': row['delivery_crew'], 'username': row['delivery_crew__username']}
+                    if row['delivery_crew'] is not None else None),
+                'status': row['status'],
+                'date': row['date'].isoformat(),
+                'total': price(row['total']),
+                'order_items': items.get(row['id'], []),
+            }
+            for row in rows
+        ]
+
+
+class ArchivedOrderRows(OrderRows):
+    # Rows of hot and archived orders together, an id is only ever in one
+    item_models = [OrderItem, ArchivedOrderItem]
+
+
+class OrderSummaryRows:
+    # The OrderSummarySerializer shape
+    values = ['id', 'user', 'delivery_crew', 'status', 'date', 'total', 'item_count', 'item_titles']
+
+    def build(self, rows):
+        price = price_field.to_representation
+        return [{**row, 'date': row['date'].isoformat(), 'total': price(row['total'])} for row in rows]
+
+
+class FastJSONRenderer(JSONRenderer):
+    # Compact output through orjson when it is installed, the stock renderer
+    # otherwise and for indented (browsable) output
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self.encoder.default)
+        # Same escaping of the JavaScript line separators as JSONRenderer
+        if b'\xe2\x80' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+class FastListMixin:
+    # GET lists skip the serializer when settings.FAST_LIST_RENDERING is on:
+    # the page is fetched as a values() projection and fast_rows_class builds
+    # the response rows. Other serializer classes (e.g. ?view=summary) are
+    # left to the regular path.
+    fast_rows_class = None
+
+    def use_fast_path(self):
+        return (settings.FAST_LIST_RENDERING and self.request.method == 'GET'
+                and self.get_serializer_class() is self.serializer_class)
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not settings.FAST_LIST_RENDERING:
+            return renderers
+        return [FastJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+
+    def fast_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        return queryset.prefetch_related(None).values(*self.fast_rows_class.values)
+
+    def fast_data(self, rows):
+        with time_serializer():
+            return self.fast_rows_class().build(rows)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_path():
+            return super().list(request, *args, **kwargs)
+        queryset = self.fast_queryset()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.fast_data(page))
+        return Response(self.fast_data(list(queryset)))
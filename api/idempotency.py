@@ -0,0 +1,85 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    payload = json.dumps([request.method, request.path, request.data], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def expired_before():
+    return timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response({"message": f"{HEADER} was already used for a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(method):
+    # Runs the view at most once per user and Idempotency-Key and replays the
+    # stored response to retries. The key row is inserted in the same
+    # transaction as the work, so a concurrent retry blocks on the unique key
+    # until the first request commits and then replays it. Only responses
+    # the view returns with a status below 500 are stored. Returned 5xx and
+    # every raised exception roll the key back, including the 4xx DRF
+    # renders for them (validation errors, 404), so a corrected request can
+    # reuse the key.
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return method(self, request, *args, **kwargs)
+        if not 0 < len(key) <= MAX_KEY_LENGTH:
+            return Response({"message": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None:
+            if record.created >= expired_before():
+                return replay(record, fingerprint)
+            record.delete()
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(user=request.user, key=key, fingerprint=fingerprint)
+            except IntegrityError:
+                record = None
+            if record is not None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                    return response
+                record.status_code = response.status_code
+                record.response = response.data
+                record.save(update_fields=['status_code', 'response'])
+                return response
+
+        # Lost the race to a request with the same key that has committed
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is None:
+            return Response({"message": "A request with this key is in progress"},
+                            status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+        return replay(record, fingerprint)
+    return wrapper
+
+
+def prune_idempotency_keys():
+    deleted, _ = IdempotencyKey.objects.filter(created__lt=expired_before()).delete()
+    return deleted
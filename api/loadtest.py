@@ -0,0 +1,154 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .utils import percentile
+
+# One planned API call. token is a JWT access token or None for anonymous.
+Call = namedtuple('Call', 'scenario method path data token')
+
+
+def call_headers(call):
+    headers = {'Content-Type': 'application/json'}
+    if call.token:
+        headers['Authorization'] = f'JWT {call.token}'
+    return headers
+
+
+def timed(request):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return (time.perf_counter() - start) * 1000, status
+
+
+def timed_request(base_url, call):
+    body = json.dumps(call.data).encode() if call.data is not None else None
+    return timed(urllib.request.Request(base_url + call.path, data=body, method=call.method, headers=call_headers(call)))
+
+
+def timed_get(url, headers):
+    return timed(urllib.request.Request(url, headers=headers or {}))
+
+
+def latency_report(timings, elapsed, errors, queries=None):
+    report = {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': round(len(timings) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+    }
+    if queries is not None:
+        report['queries_per_request'] = round(sum(queries) / len(queries), 2) if queries else 0
+    return report
+
+
+def summarize(results, elapsed):
+    # results are (scenario, ms, status, queries or None) tuples
+    def report(rows):
+        queries = [row[3] for row in rows] if rows and rows[0][3] is not None else None
+        errors = sum(1 for row in rows if row[2] is None or row[2] >= 400)
+        return latency_report([row[1] for row in rows], elapsed, errors, queries)
+
+    summary = {'all': report(results)}
+    for scenario in sorted({row[0] for row in results}):
+        summary[scenario] = report([row for row in results if row[0] == scenario])
+    return summary
+
+
+def run_calls(base_url, calls, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda call: (call.scenario, *timed_request(base_url, call), None), calls))
+    return summarize(results, time.perf_counter() - start)
+
+
+def run_in_process(calls):
+    # Replay through the Django test client, counting queries per call.
+    # Throttling is off, the mix sends many requests per user.
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+    results = []
+    start = time.perf_counter()
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                           THROTTLING={**settings.THROTTLING, 'ENABLED': False}):
+        for call in calls:
+            extra = {}
+            if call.token:
+                extra['HTTP_AUTHORIZATION'] = f'JWT {call.token}'
+            body = json.dumps(call.data) if call.data is not None else ''
+            with CaptureQueriesContext(connection) as queries:
+                request_start = time.perf_counter()
+                response = client.generic(call.method, call.path, body, content_type='application/json', **extra)
+                duration = (time.perf_counter() - request_start) * 1000
+            results.append((call.scenario, duration, response.status_code, len(queries)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def run_load(base_url, paths, requests, concurrency, headers=None):
+    # Fire `requests` GETs cycling through `paths` from `concurrency` threads
+    urls = [base_url + paths[i % len(paths)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda url: timed_get(url, headers), urls))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for _, status in results if status is None or status >= 400)
+    return latency_report([timing for timing, _ in results], elapsed, errors)
+
+
+def wait_for_server(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if timed_get(url, None)[1] is not None:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def request_mix(requests, menu_item_ids, category_titles, customer_tokens, crew_tokens, manager_token=None, random_seed=0):
+    # Catalog browsing, customer checkouts and delivery crew polling, roughly
+    # in the proportions seen at lunch peak
+    rng = random.Random(random_seed)
+    pages = max(1, len(menu_item_ids) // 12)
+    calls = []
+    while len(calls) < requests:
+        roll = rng.random()
+        if roll < 0.6:
+            calls.append(rng.choice([
+                Call('browse', 'GET', f'/api/menu-items?page={rng.randint(1, pages)}', None, None),
+                Call('browse', 'GET', '/api/menu-items?ordering=price', None, None),
+                Call('browse', 'GET', f'/api/menu-items?search={quote(rng.choice(category_titles))}', None, None),
+                Call('browse', 'GET', f'/api/menu-items/{rng.choice(menu_item_ids)}', None, None),
+                Call('browse', 'GET', '/api/categories', None, None),
+                Call('browse', 'GET', '/api/menu-items/counts', None, None),
+            ]))
+        elif roll < 0.75:
+            token = rng.choice(customer_tokens)
+            upsert = [{'menuitem': menu_item_id, 'quantity': rng.randint(1, 3)}
+                      for menu_item_id in rng.sample(menu_item_ids, min(3, len(menu_item_ids)))]
+            calls += [
+                Call('checkout', 'PATCH', '/api/cart/menu-items', {'upsert': upsert}, token),
+                Call('checkout', 'GET', '/api/cart/menu-items', None, token),
+                Call('checkout', 'POST', '/api/orders', {}, token),
+            ]
+        elif roll < 0.95 or manager_token is None:
+            calls.append(Call('crew', 'GET', '/api/orders', None, rng.choice(crew_tokens)))
+        else:
+            calls.append(Call('manager', 'GET', f'/api/orders?page={rng.randint(1, 5)}', None, manager_token))
+    return calls[:requests]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.archive import archive_orders, ARCHIVE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than the archive age to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='archive orders older than this, settings.ORDER_ARCHIVE_AFTER_DAYS by default')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        archived = archive_orders(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{archived} orders archived'))
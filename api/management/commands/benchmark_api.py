@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+from api.loadtest import request_mix, run_calls, run_in_process, wait_for_server
+from api.models import Category, MenuItem
+from api.seed import seed
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and replay a mix of catalog, checkout and '
+            'delivery crew requests in-process and through a local server')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--menu-items', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--delivery-crew', type=int, default=20)
+        parser.add_argument('--carts', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--mode', choices=['in-process', 'server', 'both'], default='both')
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--output', help='write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        # A file backed test database, so the server process can open it too
+        tmpdir = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir.name, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            tmpdir.cleanup()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        counts = seed(
+            categories=options['categories'], menu_items=options['menu_items'], users=options['users'],
+            delivery_crew=options['delivery_crew'], carts=options['carts'], orders=options['orders'],
+            random_seed=options['random_seed'])
+
+        manager = User.objects.create(username='benchmark_manager')
+        manager.groups.add(Group.objects.get_or_create(name='manager')[0])
+        customers = User.objects.filter(groups=None).exclude(pk=manager.pk)
+        crew = User.objects.filter(groups__name='delivery_crew')
+        calls = request_mix(
+            options['requests'],
+            list(MenuItem.objects.values_list('id', flat=True)),
+            list(Category.objects.values_list('title', flat=True)),
+            [str(AccessToken.for_user(user)) for user in customers],
+            [str(AccessToken.for_user(user)) for user in crew],
+            str(AccessToken.for_user(manager)),
+            random_seed=options['random_seed'])
+
+        report = {
+            'vendor': connection.vendor,
+            'seed': counts,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'workers': options['workers'],
+        }
+        if options['mode'] in ('in-process', 'both'):
+            report['in_process'] = run_in_process(calls)
+        if options['mode'] in ('server', 'both'):
+            report['server'] = self.run_server(calls, options)
+        return report
+
+    def run_server(self, calls, options):
+        port = str(options['port'])
+        env = {**os.environ, 'DATABASE_NAME': str(connection.settings_dict['NAME'])}
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'simplehub.wsgi:application',
+             '--workers', str(options['workers']), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            env=env)
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            if not wait_for_server(base_url + '/api/categories'):
+                raise CommandError('server did not start')
+            return run_calls(base_url, calls, options['concurrency'])
+        finally:
+            server.terminate()
+            server.wait()
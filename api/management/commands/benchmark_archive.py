@@ -0,0 +1,98 @@
+import json
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from api.archive import archive_orders
+from api.models import Order, ArchivedOrder
+from api.seed import seed
+from api.utils import percentile
+
+
+def list_requests():
+    manager = User.objects.create(username='benchmark_manager', is_staff=True)
+    manager.groups.get_or_create(name='manager')
+    customer_id = Order.objects.values_list('user_id', flat=True).first()
+    crew_id = Order.objects.exclude(delivery_crew=None).values_list('delivery_crew_id', flat=True).first()
+    return {
+        'manager_first_page': (manager, '/api/orders'),
+        'manager_page_50': (manager, '/api/orders?page=50'),
+        'manager_summary': (manager, '/api/orders?view=summary'),
+        'manager_cursor': (manager, '/api/orders?cursor='),
+        'customer_orders': (User.objects.get(pk=customer_id), '/api/orders'),
+        'crew_orders': (User.objects.get(pk=crew_id), '/api/orders'),
+        'manager_include_archived': (manager, '/api/orders?include_archived=true'),
+    }
+
+
+def measure(requests, repeat):
+    client = APIClient()
+    results = {}
+    for name, (user, path) in requests.items():
+        client.force_authenticate(user=user)
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(path)
+                timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            'status': response.status_code,
+            'queries': len(queries),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+        }
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and compare order list latency before and after archiving'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=730, help='spread of seeded order dates')
+        parser.add_argument('--archive-after', type=int, default=90, help='archive delivered orders older than this')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--output', help='write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                                   THROTTLING={**settings.THROTTLING, 'ENABLED': False}):
+                report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        counts = seed(users=options['users'], orders=options['orders'], days=options['days'])
+        requests = list_requests()
+        before = measure(requests, options['repeat'])
+
+        start = time.perf_counter()
+        archived = archive_orders(options['archive_after'])
+        archive_seconds = time.perf_counter() - start
+        after = measure(requests, options['repeat'])
+
+        return {
+            'vendor': connection.vendor,
+            'seed': counts,
+            'archived': archived,
+            'archive_seconds': round(archive_seconds, 2),
+            'hot_orders': Order.objects.count(),
+            'archived_orders': ArchivedOrder.objects.count(),
+            'before': before,
+            'after': after,
+        }
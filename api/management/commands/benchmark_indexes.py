@@ -0,0 +1,84 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from api.models import Category, MenuItem, Cart, Order
+from api.seed import seed
+from api.utils import percentile
+
+
+def query_shapes():
+    user_id = Order.objects.values_list('user_id', flat=True).first()
+    crew_id = Order.objects.exclude(delivery_crew=None).values_list('delivery_crew_id', flat=True).first()
+    cart_user_id = Cart.objects.values_list('user_id', flat=True).first()
+    category = Category.objects.first()
+    return {
+        'orders_by_user': Order.objects.filter(user_id=user_id).order_by('-date', '-id')[:12],
+        'orders_by_delivery_crew': Order.objects.filter(delivery_crew_id=crew_id).order_by('-date', '-id')[:12],
+        'cart_by_user': Cart.objects.filter(user_id=cart_user_id).select_related('menuitem').order_by('menuitem__title'),
+        'menu_items_by_category': MenuItem.objects.filter(category=category).order_by('price', 'id')[:12],
+        'menu_items_search_category_title': MenuItem.objects.filter(category__title__icontains=category.title[-3:]).order_by('price')[:12],
+    }
+
+
+def measure(repeat):
+    results = {}
+    for name, queryset in query_shapes().items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            'plan': queryset.explain(),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+        }
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and compare query plans and latency without and with the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menu-items', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--output', help='write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, options):
+        counts = seed(menu_items=options['menu_items'], users=options['users'], orders=options['orders'])
+        indexes = [(model, index) for model in (MenuItem, Cart, Order) for index in model._meta.indexes]
+
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        before = measure(options['repeat'])
+
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+        after = measure(options['repeat'])
+
+        return {
+            'vendor': connection.vendor,
+            'seed': counts,
+            'indexes': [index.name for model, index in indexes],
+            'before': before,
+            'after': after,
+        }
@@ -0,0 +1,69 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from api import fastpath
+from api.models import MenuItem, Order
+from api.seed import seed
+from api.serializers import MenuItemSerializer, OrderSerializer
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def compare(queryset, serializer_class, rows_class, repeat):
+    # Serialize and render the same rows both ways, fetch included
+    def serializer_path():
+        return JSONRenderer().render(serializer_class(
+            serializer_class.setup_eager_loading(queryset.all()), many=True).data)
+
+    def fast_path():
+        return fastpath.FastJSONRenderer().render(rows_class().build(list(queryset.values(*rows_class.values))))
+
+    rows = queryset.count()
+    serializer_seconds = best_of(repeat, serializer_path)
+    fast_seconds = best_of(repeat, fast_path)
+    return {
+        'rows': rows,
+        'serializer_us_per_row': round(serializer_seconds / rows * 1e6, 2),
+        'fast_us_per_row': round(fast_seconds / rows * 1e6, 2),
+        'speedup': round(serializer_seconds / fast_seconds, 2),
+        'same_output': serializer_path() == fast_path(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and compare serializer and fast-path list rendering per row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed(menu_items=options['rows'], orders=options['rows'])
+            report = {
+                'orjson': fastpath.orjson is not None,
+                'menu_items': compare(MenuItem.objects.order_by('id'), MenuItemSerializer,
+                                      fastpath.MenuItemRows, options['repeat']),
+                'orders': compare(Order.objects.order_by('id'), OrderSerializer,
+                                  fastpath.OrderRows, options['repeat']),
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api.loadtest import run_load, wait_for_server
+
+READ_PATHS = [
+    '/api/menu-items',
+    '/api/menu-items?page=2',
+    '/api/menu-items?ordering=-price',
+    '/api/categories',
+    '/api/menu-items/counts',
+]
+
+
+class Command(BaseCommand):
+    help = ('Load test the read endpoints under gunicorn (WSGI, sync views) and '
+            'uvicorn (ASGI, ASYNC_READ_VIEWS=1) with the same worker count')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--token', help='JWT access token, adds /api/orders to the mix')
+        parser.add_argument('--output', help='write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        workers, port = str(options['workers']), str(options['port'])
+        servers = {
+            'wsgi': ([sys.executable, '-m', 'gunicorn', 'simplehub.wsgi:application',
+                      '--workers', workers, '--bind', f'127.0.0.1:{port}'], {}),
+            'asgi': ([sys.executable, '-m', 'uvicorn', 'simplehub.asgi:application',
+                      '--workers', workers, '--port', port, '--log-level', 'warning'],
+                     {'ASYNC_READ_VIEWS': '1'}),
+        }
+        paths, headers = list(READ_PATHS), {}
+        if options['token']:
+            paths.append('/api/orders')
+            headers['Authorization'] = f"JWT {options['token']}"
+
+        base_url = f'http://127.0.0.1:{port}'
+        report = {'workers': options['workers'], 'concurrency': options['concurrency']}
+        for name, (command, env) in servers.items():
+            server = subprocess.Popen(command, env={**os.environ, **env})
+            try:
+                if not wait_for_server(base_url + READ_PATHS[0]):
+                    raise CommandError(f'{name} server did not start')
+                run_load(base_url, paths, options['concurrency'], options['concurrency'], headers)
+                report[name] = run_load(base_url, paths, options['requests'], options['concurrency'], headers)
+            finally:
+                server.terminate()
+                server.wait()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
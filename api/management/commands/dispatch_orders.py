@@ -0,0 +1,28 @@
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import metrics
+from api.dispatcher import dispatch, DISPATCH_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Assign unassigned orders to the least loaded delivery crew members'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DISPATCH_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, help='stop after this many batches')
+        parser.add_argument('--loop', action='store_true', help='keep polling for new orders')
+        parser.add_argument('--interval', type=float, default=5, help='seconds to sleep when idle in --loop mode')
+        parser.add_argument('--metrics-port', type=int, help='serve the dispatcher metrics at /metrics on this port')
+
+    def handle(self, *args, **options):
+        if options['metrics_port'] is not None:
+            metrics.serve(options['metrics_port'], settings.METRICS['TOKEN'])
+        while True:
+            report = dispatch(options['batch_size'], options['max_batches'])
+            if report['orders'] or not options['loop']:
+                self.stdout.write(json.dumps(report))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
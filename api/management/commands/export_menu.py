@@ -0,0 +1,19 @@
+import sys
+from django.core.management.base import BaseCommand
+from api.bulk_io import export_menu_items
+
+
+class Command(BaseCommand):
+    help = 'Stream all menu items as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', help='write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            output.writelines(export_menu_items(options['format']))
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,29 @@
+import sys
+from datetime import date
+from django.core.management.base import BaseCommand
+from api.bulk_io import export_orders
+
+
+class Command(BaseCommand):
+    help = 'Stream order history with its items as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', help='write to this file instead of stdout')
+        parser.add_argument('--start', type=date.fromisoformat, help='first order date, YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='last order date, YYYY-MM-DD')
+        parser.add_argument('--status', choices=['delivered', 'pending'])
+        parser.add_argument('--delivery-crew', type=int, help='id of the assigned delivery crew user')
+        parser.add_argument('--include-archived', action='store_true', help='also export archived orders')
+
+    def handle(self, *args, **options):
+        status = {'delivered': True, 'pending': False}.get(options['status'])
+        lines = export_orders(options['format'], start=options['start'], end=options['end'],
+                              status=status, delivery_crew=options['delivery_crew'],
+                              include_archived=options['include_archived'])
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            output.writelines(lines)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,20 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.bulk_io import IMPORT_CHUNK_SIZE, file_format, import_menu_items
+
+
+class Command(BaseCommand):
+    help = 'Upsert menu items by title from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        format = options['format'] or file_format(options['path'], default=None)
+        if format is None:
+            raise CommandError('Cannot tell the format from the file name, pass --format')
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            report = import_menu_items(stream, format, chunk_size=options['chunk_size'])
+        self.stdout.write(json.dumps(report, indent=2))
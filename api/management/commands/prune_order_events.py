@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.changes import prune_order_events
+
+
+class Command(BaseCommand):
+    help = 'Delete order change feed events older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        deleted = prune_order_events(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} order events deleted'))
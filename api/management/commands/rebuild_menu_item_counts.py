@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.counters import rebuild_menu_item_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-category menu item counters'
+
+    def handle(self, *args, **options):
+        rebuild_menu_item_counts()
+        self.stdout.write(self.style.SUCCESS('Menu item counts rebuilt'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.summaries import rebuild_order_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized item count and titles of every order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_order_summaries(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} order summaries rebuilt'))
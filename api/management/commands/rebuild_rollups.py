@@ -0,0 +1,16 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from api.reports import rebuild_rollups, REBUILD_CHUNK_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily reporting rollups from orders, all dates by default'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='first day, YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='last day, YYYY-MM-DD')
+        parser.add_argument('--chunk-days', type=int, default=REBUILD_CHUNK_DAYS)
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups(options['start'], options['end'], options['chunk_days'])
+        self.stdout.write(self.style.SUCCESS(f'Rollups rebuilt for {days} days'))
@@ -0,0 +1,199 @@
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process metrics, one registry per worker, rendered in the Prometheus
+# text format by the /metrics view.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+MAX_RECORDED_SQL = 50
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, value) for labels, value in self.values.items()]
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram(Counter):
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0, 0))
+            counts = [n + (value <= bound) for n, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for labels, (counts, total, count) in self.values.items():
+                for bound, n in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', labels + (('le', bound),), n))
+                samples.append((f'{self.name}_bucket', labels + (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def histogram(self, name, help, buckets):
+        return self.register(Histogram(name, help, buckets))
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'simplehub_request_duration_seconds', 'Request latency by route', LATENCY_BUCKETS)
+request_queries = registry.histogram(
+    'simplehub_request_db_queries', 'Database queries per request by route', QUERY_BUCKETS)
+request_db_seconds = registry.counter(
+    'simplehub_request_db_seconds_total', 'Time spent in database queries by route')
+request_serializer_seconds = registry.counter(
+    'simplehub_request_serializer_seconds_total', 'Time spent in serializers by route')
+response_size = registry.histogram(
+    'simplehub_response_size_bytes', 'Response body size by route', SIZE_BUCKETS)
+throttle_decisions = registry.counter(
+    'simplehub_throttle_decisions_total', 'Token bucket throttle decisions by route')
+shed_requests = registry.counter(
+    'simplehub_shed_requests_total', 'Requests rejected by the concurrency limiter by route')
+dispatched_orders = registry.counter(
+    'simplehub_dispatched_orders_total', 'Orders assigned to delivery crew by the dispatcher')
+dispatch_batch_duration = registry.histogram(
+    'simplehub_dispatch_batch_duration_seconds', 'Duration of dispatcher batches', LATENCY_BUCKETS)
+
+
+def serve(port, token=None):
+    # Serve this process's registry at /metrics from a daemon thread, for
+    # processes outside the web workers such as management commands
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            if token and not hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {token}'):
+                self.send_error(403)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0
+        self.serializer_seconds = 0
+        self.serializer_depth = 0
+        self.sql = []
+
+
+# Context variables follow the request into sync_to_async threads, so
+# queries run by the async views are counted too
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed as an execute wrapper on every connection
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats.queries += 1
+        stats.query_seconds += duration
+        if len(stats.sql) < MAX_RECORDED_SQL:
+            stats.sql.append((sql, round(duration * 1000, 3)))
+
+
+@contextmanager
+def time_serializer():
+    # Only the outermost serializer is timed, nested ones are part of it
+    stats = current_stats.get()
+    if stats is None or stats.serializer_depth:
+        yield
+        return
+    stats.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - start
+        stats.serializer_depth -= 1
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with time_serializer():
+            return super().to_representation(instance)
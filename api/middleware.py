@@ -0,0 +1,83 @@
+import logging
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import metrics
+
+slow_request_logger = logging.getLogger('api.slow_requests')
+
+
+def match_name(match):
+    # The url name, as used by THROTTLING['ROUTES'] and STATELESS_JWT_ROUTES,
+    # or the pattern of unnamed routes
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.route
+
+
+def route_name(request):
+    return match_name(getattr(request, 'resolver_match', None))
+
+
+class MetricsMiddleware:
+    # Records latency, query count and time, serializer time and response size
+    # per route, and logs a sample of slow requests with their SQL
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS['ENABLED']:
+            return self.get_response(request)
+
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS['ENABLED']:
+            return await self.get_response(request)
+
+        # Sync views and queries run with a copy of this context, so they
+        # add to the same stats object
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, duration):
+        route, method = route_name(request), request.method
+        metrics.request_duration.observe(duration, route=route, method=method, status=response.status_code)
+        metrics.request_queries.observe(stats.queries, route=route, method=method)
+        metrics.request_db_seconds.inc(stats.query_seconds, route=route, method=method)
+        metrics.request_serializer_seconds.inc(stats.serializer_seconds, route=route, method=method)
+        if not response.streaming:
+            metrics.response_size.observe(len(response.content), route=route, method=method)
+
+        if (duration * 1000 >= settings.METRICS['SLOW_REQUEST_MS']
+                and random.random() < settings.METRICS['SLOW_REQUEST_SAMPLE_RATE']):
+            slow_request_logger.warning(
+                'Slow request %s %s (%s) took %.1fms, %d queries in %.1fms, serializers %.1fms',
+                method, request.get_full_path(), route, duration * 1000, stats.queries,
+                stats.query_seconds * 1000, stats.serializer_seconds * 1000,
+                extra={'sql': stats.sql})
+            for sql, ms in stats.sql:
+                slow_request_logger.warning('  %.3fms %s', ms, sql)
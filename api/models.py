@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from datetime import date
 # Create your models here.
 class Category(models.Model):
@@ -21,9 +22,19 @@ class MenuItem(models.Model):
 
     class Meta:
         ordering = ['category']
+        indexes = [
+            models.Index(fields=['category', 'price'], name='menuitem_category_price_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title} ({self.category})'
+class MenuItemCount(models.Model):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name='menu_item_count')
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.category} ({self.count})'
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -40,6 +51,15 @@ class Order(models.Model):
     status = models.BooleanField(default=False, db_index=True)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, default=date.today)
+    # Denormalized from the order items for the summary listing
+    item_count = models.PositiveIntegerField(default=0)
+    item_titles = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', '-date', '-id'], name='order_crew_date_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} ({self.date})'
@@ -53,4 +73,103 @@ class OrderItem(models.Model):
         unique_together = ('order', 'menuitem')        
 
     def __str__(self):
-        return f'{self.menuitem} (qty: {self.quantity})'
\ No newline at end of file
+        return f'{self.menuitem} (qty: {self.quantity})'
+
+class OrderEvent(models.Model):
+    # Append-only log of order changes, the id doubles as the feed version
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    kind = models.CharField(max_length=20)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='orderevent_user_idx'),
+            models.Index(fields=['delivery_crew', 'id'], name='orderevent_crew_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id} {self.kind} ({self.created})'
+
+class IdempotencyKey(models.Model):
+    # Stored result of a request made with an Idempotency-Key header
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f'{self.user_id} {self.key} ({self.status_code})'
+
+# Completed orders moved out of the hot tables by api.archive, keeping
+# their original ids
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True)
+    status = models.BooleanField(default=True)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField(db_index=True)
+    item_count = models.PositiveIntegerField(default=0)
+    item_titles = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='archivedorder_user_date_idx'),
+            models.Index(fields=['delivery_crew', '-date', '-id'], name='archivedorder_crew_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.id} ({self.date})'
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+    quantity = models.SmallIntegerField()
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        unique_together = ('order', 'menuitem')
+
+    def __str__(self):
+        return f'{self.menuitem_id} (qty: {self.quantity})'
+
+# Daily rollups for the reporting endpoints, maintained by api.reports
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.date} ({self.orders})'
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+    def __str__(self):
+        return f'{self.date} {self.menuitem_id} ({self.quantity})'
+
+class DailyCrewDeliveries(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    delivered = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
+
+    def __str__(self):
+        return f'{self.date} {self.delivery_crew_id} ({self.delivered})'
@@ -0,0 +1,135 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def invert(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+class KeysetPagination(PageNumberPagination):
+    # Page numbers by default. Passing ?cursor= (empty for the first page)
+    # switches to keyset pages: no COUNT(*), no OFFSET, and the position is
+    # an opaque cursor over the view's cursor_ordering_fields plus id.
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.ordering = self.get_ordering(queryset, view)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = [invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.rows = rows
+        return rows
+
+    def get_ordering(self, queryset, view):
+        # Keep whatever OrderingFilter or get_queryset applied when the fields
+        # are allowed for cursors, and always break ties on id
+        allowed = getattr(view, 'cursor_ordering_fields', [])
+        ordering = [field for field in queryset.query.order_by
+                    if isinstance(field, str) and field.lstrip('-') in allowed]
+        if not ordering:
+            ordering = list(getattr(view, 'cursor_ordering', []))
+        if not ordering or ordering[-1].lstrip('-') != 'id':
+            ordering.append('-id' if ordering and ordering[-1].startswith('-') else 'id')
+        return ordering
+
+    def keyset_filter(self, ordering, position):
+        # (a > x) or (a = x and b > y) or ... for ascending fields, lt for descending
+        condition = Q()
+        for i, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            term = Q(**{f'{field.lstrip("-")}__{lookup}': position[i]})
+            for previous, value in zip(ordering[:i], position):
+                term &= Q(**{previous.lstrip('-'): value})
+            condition |= term
+        return condition
+
+    def field_value(self, obj, field):
+        if isinstance(obj, dict):
+            # values() rows of the fast list path
+            return obj[field.lstrip('-')]
+        return reduce(getattr, field.lstrip('-').split('__'), obj)
+
+    def encode_cursor(self, obj, reverse):
+        cursor = {
+            'o': self.ordering,
+            'p': [self.field_value(obj, field) for field in self.ordering],
+            'r': reverse,
+        }
+        token = urlsafe_b64encode(json.dumps(cursor, cls=DjangoJSONEncoder).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def model_field(self, model, field):
+        *relations, name = field.lstrip('-').split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(token.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if cursor['o'] != self.ordering or len(position) != len(self.ordering):
+                raise ValueError
+            # Values go straight into the keyset filter, so check their types
+            position = [self.model_field(model, field).to_python(value)
+                        for field, value in zip(self.ordering, position)]
+            if None in position:
+                raise ValueError
+        except (TypeError, KeyError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[0], True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -1,5 +1,6 @@
 from rest_framework import permissions
+from .roles import get_roles
 
 class IsManager(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="manager").exists()
+        return 'manager' in get_roles(request)
@@ -0,0 +1,140 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, Sum, Value, When
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySales, DailyMenuItemSales, DailyCrewDeliveries
+
+REBUILD_CHUNK_DAYS = 31
+# Hot and archived orders with their items
+ORDER_SOURCES = [(Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)]
+
+
+def add_to_rollup(model, day, deltas, key=None):
+    # Make sure the rows exist, then add every delta in a single UPDATE.
+    # deltas maps the key value (None for the per-day table) to {field: amount}.
+    keys = list(deltas)
+    model.objects.bulk_create(
+        [model(date=day, **({key: value} if key else {})) for value in keys], ignore_conflicts=True)
+    rows = model.objects.filter(date=day)
+    fields = deltas[keys[0]]
+    if key is None:
+        rows.update(**{field: F(field) + amount for field, amount in fields.items()})
+    else:
+        rows.filter(**{f'{key}__in': keys}).update(**{
+            field: F(field) + Case(*[
+                When(**{key: value}, then=Value(amounts[field])) for value, amounts in deltas.items()
+            ])
+            for field in fields
+        })
+
+
+def record_sale(order, items):
+    # items are the (menuitem_id, quantity, price) lines of a new order
+    add_to_rollup(DailySales, order.date, {None: {'orders': 1, 'revenue': order.total}})
+    add_to_rollup(DailyMenuItemSales, order.date, {
+        menuitem_id: {'quantity': quantity, 'revenue': price}
+        for menuitem_id, quantity, price in items
+    }, key='menuitem_id')
+
+
+def record_delivery(order, was_delivered, previous_crew_id):
+    record_deliveries([(order, was_delivered, previous_crew_id)])
+
+
+def record_deliveries(changes):
+    # Move deliveries between crew members when status or crew changed.
+    # changes are (order, was_delivered, previous_crew_id) tuples, updated
+    # with one UPDATE per order date.
+    days = {}
+    for order, was_delivered, previous_crew_id in changes:
+        deltas = days.setdefault(order.date, {})
+        if was_delivered and previous_crew_id is not None:
+            deltas[previous_crew_id] = deltas.get(previous_crew_id, 0) - 1
+        if order.status and order.delivery_crew_id is not None:
+            deltas[order.delivery_crew_id] = deltas.get(order.delivery_crew_id, 0) + 1
+    for day, deltas in days.items():
+        deltas = {crew_id: {'delivered': delta} for crew_id, delta in deltas.items() if delta}
+        if deltas:
+            add_to_rollup(DailyCrewDeliveries, day, deltas, key='delivery_crew_id')
+
+
+def sum_rows(querysets, keys):
+    # Add up aggregate rows of the same shape from several querysets
+    totals = {}
+    for queryset in querysets:
+        for row in queryset:
+            key = tuple(row[field] for field in keys)
+            if key in totals:
+                for field, value in row.items():
+                    if field not in keys:
+                        totals[key][field] += value
+            else:
+                totals[key] = row
+    return totals.values()
+
+
+def rebuild_rollups(start=None, end=None, chunk_days=REBUILD_CHUNK_DAYS):
+    # Recompute the rollups from hot and archived orders, aggregating in the
+    # db one chunk of days per transaction. Returns the number of days covered.
+    if start is None or end is None:
+        bounds = [model.objects.aggregate(start=Min('date'), end=Max('date')) for model, _ in ORDER_SOURCES]
+        start = start or min((b['start'] for b in bounds if b['start']), default=None)
+        end = end or max((b['end'] for b in bounds if b['end']), default=None)
+    if start is None or end is None or start > end:
+        return 0
+
+    day = start
+    while day <= end:
+        last = min(day + timedelta(days=chunk_days - 1), end)
+        orders = [model.objects.filter(date__range=(day, last)).order_by() for model, _ in ORDER_SOURCES]
+        items = [model.objects.filter(order__date__range=(day, last)).order_by() for _, model in ORDER_SOURCES]
+        with transaction.atomic():
+            for model in (DailySales, DailyMenuItemSales, DailyCrewDeliveries):
+                model.objects.filter(date__range=(day, last)).delete()
+            DailySales.objects.bulk_create([
+                DailySales(**row)
+                for row in sum_rows([
+                    queryset.values('date').annotate(orders=Count('id'), revenue=Sum('total'))
+                    for queryset in orders
+                ], ['date'])
+            ])
+            DailyMenuItemSales.objects.bulk_create([
+                DailyMenuItemSales(date=row['order__date'], menuitem_id=row['menuitem'],
+                                   quantity=row['total_quantity'], revenue=row['total_revenue'])
+                for row in sum_rows([
+                    queryset.values('order__date', 'menuitem').annotate(
+                        total_quantity=Sum('quantity'), total_revenue=Sum('price'))
+                    for queryset in items
+                ], ['order__date', 'menuitem'])
+            ])
+            DailyCrewDeliveries.objects.bulk_create([
+                DailyCrewDeliveries(**row)
+                for row in sum_rows([
+                    queryset.filter(status=True, delivery_crew__isnull=False)
+                    .values('date', 'delivery_crew_id').annotate(delivered=Count('id'))
+                    for queryset in orders
+                ], ['date', 'delivery_crew_id'])
+            ])
+        day = last + timedelta(days=1)
+    return (end - start).days + 1
+
+
+def revenue_by_day(start, end):
+    return DailySales.objects.filter(date__range=(start, end)).order_by('date').values('date', 'orders', 'revenue')
+
+
+def top_menu_items(start, end, limit):
+    return (
+        DailyMenuItemSales.objects.filter(date__range=(start, end))
+        .values('menuitem', title=F('menuitem__title'))
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        .order_by('-total_quantity', 'menuitem')[:limit]
+    )
+
+
+def crew_deliveries(start, end):
+    return (
+        DailyCrewDeliveries.objects.filter(date__range=(start, end))
+        .values('delivery_crew', username=F('delivery_crew__username'))
+        .annotate(total_delivered=Sum('delivered'))
+        .order_by('-total_delivered', 'delivery_crew')
+    )
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+ROLES_CACHE_TIMEOUT = 60 * 5
+
+
+def roles_cache_key(user_id):
+    return f'roles:{user_id}'
+
+
+def load_roles(user_id):
+    key = roles_cache_key(user_id)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(Group.objects.filter(user__id=user_id).values_list('name', flat=True))
+        cache.set(key, roles, ROLES_CACHE_TIMEOUT)
+    return roles
+
+
+def invalidate_roles(*user_ids):
+    cache.delete_many([roles_cache_key(user_id) for user_id in user_ids])
+
+
+def token_roles(token):
+    # Roles carried in the JWT claims, only trusted when ROLES_FROM_TOKEN is on
+    if token is None or not getattr(settings, 'ROLES_FROM_TOKEN', False):
+        return None
+    try:
+        roles = token.get('roles')
+    except AttributeError:
+        return None
+    return frozenset(roles) if roles is not None else None
+
+
+def get_roles(request):
+    # Group names of the requesting user, resolved once per request
+    user = request.user
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(request, '_roles', None)
+    if roles is None:
+        roles = token_roles(request.auth)
+        if roles is None:
+            roles = load_roles(user.pk)
+        request._roles = roles
+    return roles
@@ -0,0 +1,126 @@
+import contextvars
+import random
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+# The request being served while its reads may go to a replica. Only set for
+# safe-method requests, so writes, locking reads in transactions, management
+# commands and the shell always use the primary.
+replica_request = contextvars.ContextVar('replica_request', default=None)
+
+
+def pin_key(user_id):
+    return f'primary:{user_id}'
+
+
+def request_user(request):
+    # The user once authentication has run, without triggering it. DRF sets
+    # the authenticated user on the Django request.
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return user
+
+
+def reads_from_primary(request):
+    # Users that wrote in the last few seconds read their own writes from
+    # the primary while the replicas catch up
+    user = request_user(request)
+    if user is None or not user.is_authenticated:
+        return False
+    if not hasattr(request, '_read_primary'):
+        request._read_primary = cache.get(pin_key(user.pk), False)
+    return request._read_primary
+
+
+def pin_to_primary(user):
+    cache.set(pin_key(user.pk), True, settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+async def apin_to_primary(user):
+    await cache.aset(pin_key(user.pk), True, settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+@contextmanager
+def use_primary():
+    token = replica_request.set(None)
+    try:
+        yield
+    finally:
+        replica_request.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        request = replica_request.get()
+        if request is None or not settings.DATABASE_REPLICAS or model._meta.app_label == 'sessions':
+            return 'default'
+        if reads_from_primary(request):
+            return 'default'
+        # One replica per request so a count and its page agree
+        if not hasattr(request, '_replica'):
+            request._replica = random.choice(settings.DATABASE_REPLICAS)
+        return request._replica
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    # Lets safe-method requests read from the replicas and pins users that
+    # changed something to the primary for REPLICA_READ_YOUR_WRITES_SECONDS
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        token = replica_request.set(request if safe else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_request.reset(token)
+
+        if self.should_pin(request, response, safe):
+            pin_to_primary(request_user(request))
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        # Sync views run with a copy of this context, so the router sees
+        # the request there too
+        safe = request.method in SAFE_METHODS
+        token = replica_request.set(request if safe else None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_request.reset(token)
+
+        if self.should_pin(request, response, safe):
+            await apin_to_primary(request_user(request))
+        return response
+
+    def should_pin(self, request, response, safe):
+        user = request_user(request)
+        return not safe and response.status_code < 400 and user is not None and user.is_authenticated
@@ -0,0 +1,97 @@
+import re
+from django.db import connections
+from django.db.models import Q
+
+# Full-text search over menu item titles and descriptions. SQLite uses an
+# FTS5 table kept in sync by triggers, MySQL a FULLTEXT index on the table
+# itself, other backends fall back to icontains scans. Triggers and InnoDB
+# keep the index current for every write, bulk ones included.
+
+FTS_TABLE = 'api_menuitem_fts'
+FULLTEXT_INDEX = 'menuitem_fulltext_idx'
+TITLE_WEIGHT = 10.0
+MAX_TERMS = 8
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='api_menuitem', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON api_menuitem BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON api_menuitem BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description ON api_menuitem BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+MYSQL_MATCH = 'MATCH(api_menuitem.title, api_menuitem.description) AGAINST (%s IN BOOLEAN MODE)'
+
+
+def search_terms(text):
+    # Words of the query, each matched as a prefix for type-ahead
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def ensure_search_index(using='default'):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            exists = FTS_TABLE in connection.introspection.table_names(cursor)
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            if not exists:
+                # Index the rows that were there before the table
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT 1 FROM information_schema.statistics '
+                'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s',
+                ['api_menuitem', FULLTEXT_INDEX])
+            if cursor.fetchone() is None:
+                cursor.execute(f'ALTER TABLE api_menuitem ADD FULLTEXT INDEX {FULLTEXT_INDEX} (title, description)')
+
+
+def rebuild_search_index(using='default'):
+    connection = connections[using]
+    ensure_search_index(using)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search(queryset, text):
+    # Restrict queryset to items matching every term and order them by
+    # relevance, best first. The database is the one the queryset reads from.
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            select={'rank': f'bm25({FTS_TABLE}, %s, 1.0)'},
+            select_params=[TITLE_WEIGHT],
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = api_menuitem.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            order_by=['rank', 'id'],
+        )
+    if vendor == 'mysql':
+        match = ' '.join(f'+{term}*' for term in terms)
+        return queryset.extra(
+            select={'rank': MYSQL_MATCH},
+            select_params=[match],
+            where=[MYSQL_MATCH],
+            params=[match],
+            order_by=['-rank', 'id'],
+        )
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition).order_by('title', 'id')
@@ -0,0 +1,96 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .catalog import bump_catalog_version
+from .counters import rebuild_menu_item_counts
+from .summaries import item_summary
+from .reports import rebuild_rollups
+
+
+def bulk_create(model, objs, batch_size):
+    # bulk_create only sets primary keys on backends that can return them
+    # (not MySQL), so read back the newest ids on the others
+    created = model.objects.bulk_create(objs, batch_size=batch_size)
+    if created and created[0].pk is None:
+        ids = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(created)]
+        for obj, pk in zip(created, reversed(list(ids))):
+            obj.pk = pk
+    return created
+
+
+def seed(categories=10, menu_items=500, users=100, delivery_crew=10, carts=50,
+         orders=5000, items_per_order=3, days=365, batch_size=1000, random_seed=0):
+    # Bulk load a synthetic catalog, customers, crew, carts and order history
+    rng = random.Random(random_seed)
+    prefix = f'seed{rng.randrange(10 ** 8)}'
+    today = date.today()
+
+    with transaction.atomic():
+        category_objs = bulk_create(Category, [
+            Category(title=f'{prefix} category {i}', slug=f'{prefix}-category-{i}')
+            for i in range(categories)
+        ], batch_size)
+        menu_item_objs = bulk_create(MenuItem, [
+            MenuItem(
+                title=f'{prefix} item {i}',
+                price=Decimal(rng.randrange(100, 5000)) / 100,
+                featured=rng.random() < 0.1,
+                category=rng.choice(category_objs),
+                description=f'Menu item {i}',
+            )
+            for i in range(menu_items)
+        ], batch_size)
+        user_objs = bulk_create(User, [
+            User(username=f'{prefix}_user{i}', password='!')
+            for i in range(users + delivery_crew)
+        ], batch_size)
+        customers, crew = user_objs[:users], user_objs[users:]
+
+        crew_group, _ = Group.objects.get_or_create(name='delivery_crew')
+        crew_group.user_set.add(*crew)
+
+        cart_objs = []
+        for user in customers[:carts]:
+            for menu_item in rng.sample(menu_item_objs, min(items_per_order, len(menu_item_objs))):
+                quantity = rng.randint(1, 3)
+                cart_objs.append(Cart(
+                    user=user, menuitem=menu_item, quantity=quantity,
+                    unit_price=menu_item.price, price=menu_item.price * quantity))
+        bulk_create(Cart, cart_objs, batch_size)
+
+        for start in range(0, orders, batch_size):
+            order_objs, lines = [], []
+            for _ in range(min(batch_size, orders - start)):
+                sample = rng.sample(menu_item_objs, min(items_per_order, len(menu_item_objs)))
+                line = [(menu_item, rng.randint(1, 3)) for menu_item in sample]
+                order_objs.append(Order(
+                    user=rng.choice(customers),
+                    delivery_crew=rng.choice(crew) if crew and rng.random() < 0.8 else None,
+                    status=rng.random() < 0.7,
+                    total=sum(menu_item.price * quantity for menu_item, quantity in line),
+                    date=today - timedelta(days=rng.randrange(days)),
+                    **item_summary((menu_item.title, quantity) for menu_item, quantity in line),
+                ))
+                lines.append(line)
+            bulk_create(Order, order_objs, batch_size)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=menu_item, quantity=quantity, price=menu_item.price * quantity)
+                for order, line in zip(order_objs, lines)
+                for menu_item, quantity in line
+            ], batch_size=batch_size)
+
+        rebuild_menu_item_counts()
+        rebuild_rollups()
+    transaction.on_commit(bump_catalog_version)
+
+    return {
+        'categories': len(category_objs),
+        'menu_items': len(menu_item_objs),
+        'users': len(customers),
+        'delivery_crew': len(crew),
+        'carts': len(cart_objs),
+        'orders': orders,
+    }
@@ -1,16 +1,36 @@
+import time
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from decimal import Decimal
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import Category, MenuItem, Cart, Order, OrderItem
+from .roles import load_roles
+from .metrics import TimedSerializerMixin
+from .assignment import MAX_BATCH_ORDERS
 
-class CategorySerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    # Relations the serializer walks per row, loaded up front by the views
+    select_related_fields = []
+    prefetch_related_fields = []
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'title', 'slug']
         
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ['category']
     category_name = serializers.StringRelatedField(source='category')
     category = serializers.PrimaryKeyRelatedField(queryset = Category.objects.all())
     class Meta:
@@ -20,20 +40,57 @@ class MenuItemSerializer(serializers.ModelSerializer):
             "category_name": {"read_only": True}
         }
 
-class CartSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset = User.objects.all(), default=serializers.CurrentUserDefault())
-    menuitem = serializers.PrimaryKeyRelatedField(queryset = MenuItem.objects.all())
+class MenuSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    featured = serializers.BooleanField(required=False, allow_null=True, default=None)
+    category = serializers.SlugField(required=False)
+    min_price = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
+
+class OrderExportSerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(['csv', 'jsonl'], default='csv')
+    start = serializers.DateField(required=False, default=None)
+    end = serializers.DateField(required=False, default=None)
+    status = serializers.BooleanField(required=False, allow_null=True, default=None)
+    delivery_crew = serializers.IntegerField(required=False, default=None)
+    include_archived = serializers.BooleanField(required=False, default=False)
 
     def validate(self, attrs):
-        quantity = attrs.get('quantity')
-        menuitem = attrs.get('menuitem')
-        if quantity < 1:
-            raise serializers.ValidationError("Quantity must be greater than 0")
-        
-        attrs['unit_price'] = menuitem.price
-        attrs['price'] = Decimal(menuitem.price) * Decimal(quantity)
+        if attrs['start'] and attrs['end'] and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("start must not be after end")
+        return attrs
+
+class OrderBatchUpdateSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                   max_length=MAX_BATCH_ORDERS)
+    delivery_crew = serializers.IntegerField(required=False)
+    status = serializers.BooleanField(required=False)
 
+    def validate_delivery_crew(self, value):
+        if not User.objects.filter(pk=value, groups__name='delivery_crew').exists():
+            raise serializers.ValidationError("Not a delivery crew member")
+        return value
+
+    def validate(self, attrs):
+        if 'delivery_crew' not in attrs and 'status' not in attrs:
+            raise serializers.ValidationError("Provide delivery_crew and/or status")
         return attrs
+
+def validate_cart_line(attrs, unit_price):
+    quantity = attrs.get('quantity')
+    if quantity < 1:
+        raise serializers.ValidationError("Quantity must be greater than 0")
+
+    attrs['unit_price'] = unit_price
+    attrs['price'] = Decimal(unit_price) * Decimal(quantity)
+    return attrs
+
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(queryset = User.objects.all(), default=serializers.CurrentUserDefault())
+    menuitem = serializers.PrimaryKeyRelatedField(queryset = MenuItem.objects.all())
+
+    def validate(self, attrs):
+        return validate_cart_line(attrs, attrs.get('menuitem').price)
     
     class Meta:
         model = Cart
@@ -43,7 +100,8 @@ class CartSerializer(serializers.ModelSerializer):
             'unit_price': {'read_only': True},
         }
 
-class CartUserSerializer(serializers.ModelSerializer):
+class CartUserSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ['menuitem']
     menuitem = serializers.PrimaryKeyRelatedField(queryset = MenuItem.objects.all())
     menuitem_name = serializers.SerializerMethodField()
     class Meta:
@@ -53,27 +111,86 @@ class CartUserSerializer(serializers.ModelSerializer):
     def get_menuitem_name(self, obj):
         return obj.menuitem.title
 
+class CartQuantitySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField()
+
+    def validate(self, attrs):
+        return validate_cart_line(attrs, self.context['unit_price'])
+
+class CartLineSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+
+class CartBatchSerializer(serializers.Serializer):
+    upsert = CartLineSerializer(many=True, required=False)
+    remove = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, attrs):
+        upsert = attrs.setdefault('upsert', [])
+        attrs.setdefault('remove', [])
+        menuitem_ids = [line['menuitem'] for line in upsert]
+        if len(set(menuitem_ids)) != len(menuitem_ids):
+            raise serializers.ValidationError({'upsert': "Each menu item can only appear once"})
+
+        # Resolve every price in one query
+        prices = dict(MenuItem.objects.filter(id__in=menuitem_ids).values_list('id', 'price'))
+        errors = []
+        for line in upsert:
+            if line['menuitem'] not in prices:
+                errors.append({'menuitem': [f"Invalid pk \"{line['menuitem']}\" - object does not exist."]})
+                continue
+            try:
+                validate_cart_line(line, prices[line['menuitem']])
+                errors.append({})
+            except serializers.ValidationError as e:
+                errors.append({'non_field_errors': e.detail})
+        if any(errors):
+            raise serializers.ValidationError({'upsert': errors})
+        return attrs
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['order', 'menuitem', 'quantity', 'price']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username']
 
-class OrderUpdateSerializer(serializers.ModelSerializer):
+order_items_prefetch = Prefetch('order', queryset=OrderItem.objects.order_by('id'))
+
+class OrderUpdateSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ['delivery_crew']
+    prefetch_related_fields = [order_items_prefetch]
     orderitem = OrderItemSerializer(many=True, read_only=True, source='order')
     delivery_crew = UserSerializer()
     class Meta:
         model = Order
         fields = ['id', 'user', 'delivery_crew', 'status', 'date', 'total', 'orderitem']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ['delivery_crew']
+    prefetch_related_fields = [order_items_prefetch]
     order_items = OrderItemSerializer(many=True, read_only=True, source='order')
     delivery_crew = UserSerializer(read_only=True)
     class Meta:
         model = Order
         fields = ['id', 'user', 'delivery_crew', 'status', 'date', 'total', 'order_items']
+        read_only_fields = ['user', 'total']
+
+class OrderSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Reads only columns of the order row, no joins or prefetches
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'delivery_crew', 'status', 'date', 'total', 'item_count', 'item_titles']
 
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['roles'] = sorted(load_roles(user.pk))
+        # Claims for stateless authentication, copied into refreshed tokens
+        token['username'] = user.username
+        token['auth_time'] = int(time.time())
+        return token
@@ -0,0 +1,91 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete, post_migrate
+from django.db.backends.signals import connection_created
+from django.db import transaction
+from django.dispatch import receiver
+from .models import Category, MenuItem, MenuItemCount
+from .roles import invalidate_roles
+from .authentication import revoke_user_tokens
+from .catalog import bump_catalog_version
+from .counters import adjust_menu_item_count
+from .metrics import record_query
+from .search import ensure_search_index
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_roles(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        invalidate_roles(*pk_set)
+    elif action == 'pre_clear':
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_roles_on_user_change(sender, instance, **kwargs):
+    invalidate_roles(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_tokens_of_removed_user(sender, instance, **kwargs):
+    # Stateless authentication never reads the user row, so deactivated and
+    # deleted users are shut out through the revocation cache
+    if kwargs.get('signal') is post_delete or not instance.is_active:
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_catalog(sender, instance, **kwargs):
+    # Only once the change is visible, or a concurrent read could cache the
+    # old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Category)
+def create_menu_item_count(sender, instance, created, **kwargs):
+    if created:
+        MenuItemCount.objects.get_or_create(category=instance)
+
+
+@receiver(pre_save, sender=MenuItem)
+def remember_menu_item_category(sender, instance, **kwargs):
+    instance._previous_category_id = None
+    if not instance._state.adding:
+        instance._previous_category_id = (
+            MenuItem.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first())
+
+
+@receiver(post_save, sender=MenuItem)
+def count_saved_menu_item(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_category_id', None)
+    if created:
+        adjust_menu_item_count(instance.category_id, 1)
+    elif previous is not None and previous != instance.category_id:
+        adjust_menu_item_count(previous, -1)
+        adjust_menu_item_count(instance.category_id, 1)
+
+
+@receiver(post_delete, sender=MenuItem)
+def count_deleted_menu_item(sender, instance, **kwargs):
+    adjust_menu_item_count(instance.category_id, -1)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    # The app has no migrations, so the FTS table and FULLTEXT index are
+    # created after every migrate/syncdb
+    if sender.name == 'api':
+        ensure_search_index(using)
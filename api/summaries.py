@@ -0,0 +1,29 @@
+from django.db import transaction
+from .models import Order, OrderItem
+
+
+def item_summary(lines):
+    # lines are (title, quantity) pairs in order item order
+    lines = list(lines)
+    return {
+        'item_count': sum(quantity for _, quantity in lines),
+        'item_titles': [title for title, _ in lines],
+    }
+
+
+def rebuild_order_summaries(batch_size=1000):
+    # Recompute item_count and item_titles of every order from its items
+    order_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        lines = {order_id: [] for order_id in batch}
+        items = (
+            OrderItem.objects.filter(order_id__in=batch).order_by('id')
+            .values_list('order_id', 'menuitem__title', 'quantity')
+        )
+        for order_id, title, quantity in items:
+            lines[order_id].append((title, quantity))
+        orders = [Order(id=order_id, **item_summary(order_lines)) for order_id, order_lines in lines.items()]
+        with transaction.atomic():
+            Order.objects.bulk_update(orders, ['item_count', 'item_titles'])
+    return len(order_ids)
@@ -1,11 +1,44 @@
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient, force_authenticate, APIRequestFactory
-from django.contrib.auth.models import User
-from .models import Cart, MenuItem, Category, Order
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.test import override_settings
+from django.conf import settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import Cart, MenuItem, MenuItemCount, Category, Order, OrderItem, OrderEvent, IdempotencyKey, DailyCrewDeliveries, DailySales, ArchivedOrder, ArchivedOrderItem
+from .counters import rebuild_menu_item_counts
+from .seed import seed
+from .summaries import rebuild_order_summaries
+from .changes import prune_order_events
+from .idempotency import prune_idempotency_keys
+from .reports import rebuild_rollups
+from .catalog import bump_catalog_version, is_fresh
+from .routers import ReplicaRoutingMiddleware, use_primary
+from .throttling import AdmissionControlMiddleware
+from .middleware import MetricsMiddleware
+from django.contrib.sessions.models import Session
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, AsyncRequestFactory
+from asgiref.sync import iscoroutinefunction
 from .views import CategoriesView 
-from . import serializers
+from . import serializers, async_views, loadtest, metrics, bulk_io, fastpath, authentication, dispatcher, archive
+import io
 import json
+import urllib.request
+from unittest.mock import patch
+from base64 import urlsafe_b64encode
+import os
+import tempfile
+import time
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from datetime import date, timedelta
+from django.utils import timezone
 # Create your tests here.
     
 class SerializerTestCase(TestCase):
@@ -82,3 +115,1326 @@ class MenuItemViewTestCase(TestCase):
         res = self.client.post(self.urls, {'title': 'Test_menu_item2', 'price': 20, 'category': self.category.id})
         self.assertEqual(res.status_code, 201)
 
+class OrderViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        self.category = Category.objects.create(title="Test_category", slug="test-category")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.urls = '/api/orders'
+
+    def fill_cart(self, n):
+        for i in range(n):
+            menu_item = MenuItem.objects.create(title=f"Test_menu_item{i}", price = 10, category = self.category)
+            Cart.objects.create(user=self.user, menuitem=menu_item, quantity=2, unit_price=10, price=20)
+
+    def test_checkout(self):
+        self.fill_cart(3)
+        res = self.client.post(self.urls)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(float(res.data['total']), 60)
+        self.assertEqual(len(res.data['order_items']), 3)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_checkout_empty_cart(self):
+        res = self.client.post(self.urls)
+        self.assertEqual(res.data['message'], 'Cart is empty')
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_query_count(self):
+        self.fill_cart(20)
+        # savepoint, lock cart, aggregate, titles, order, bulk items, event,
+        # daily sales and item sales (ensure + add each), clear cart, release, response items
+        with self.assertNumQueries(14):
+            res = self.client.post(self.urls)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(Order.objects.get().order.count(), 20)
+
+    def test_summary(self):
+        self.fill_cart(2)
+        order_id = self.client.post(self.urls).data['id']
+        crew = User.objects.create(username='Test_crew', password="Test_crew")
+        crew.groups.add(Group.objects.create(name='delivery_crew'))
+        Order.objects.filter(id=order_id).update(delivery_crew=crew)
+        self.client.force_authenticate(user=crew)
+        self.client.patch(f'{self.urls}/{order_id}', {'status': True})
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(self.urls, {'view': 'summary'})
+        summary = res.data['results'][0]
+        self.assertEqual(summary['item_count'], 4)
+        self.assertEqual(summary['item_titles'], ['Test_menu_item0', 'Test_menu_item1'])
+        self.assertTrue(summary['status'])
+        self.assertNotIn('order_items', summary)
+        self.assertFalse([q for q in queries if 'JOIN' in q['sql'] and 'api_order' in q['sql']])
+
+    def test_rebuild_summaries(self):
+        self.fill_cart(3)
+        order_id = self.client.post(self.urls).data['id']
+        Order.objects.update(item_count=0, item_titles=[])
+        self.assertEqual(rebuild_order_summaries(batch_size=2), 1)
+        order = Order.objects.get(id=order_id)
+        self.assertEqual(order.item_count, 6)
+        self.assertEqual(len(order.item_titles), 3)
+
+class OrderChangesTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create(username='Test_user', password="Test_user")
+        self.manager = User.objects.create(username='Test_manager', password="Test_manager")
+        self.manager.groups.add(Group.objects.create(name='manager'))
+        crew_group = Group.objects.create(name='delivery_crew')
+        self.crew = [User.objects.create(username=f'Test_crew{i}', password="Test_crew") for i in range(2)]
+        for crew in self.crew:
+            crew.groups.add(crew_group)
+        category = Category.objects.create(title="Test_category", slug="test-category")
+        menu_item = MenuItem.objects.create(title="Test_menu_item", price=10, category=category)
+        Cart.objects.create(user=self.customer, menuitem=menu_item, quantity=1, unit_price=10, price=10)
+        self.client = APIClient()
+
+    def as_user(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client
+
+    def changes(self, user, since):
+        res = self.as_user(user).get('/api/orders/changes', {'since': since})
+        self.assertEqual(res.status_code, 200)
+        return res.data
+
+    def test_customer_sees_status_changes(self):
+        version = self.as_user(self.customer).get('/api/orders/changes').data['version']
+        order_id = self.as_user(self.customer).post('/api/orders').data['id']
+        self.as_user(self.manager).patch(f'/api/orders/{order_id}', {'delivery_crew': self.crew[0].id})
+        self.as_user(self.crew[0]).patch(f'/api/orders/{order_id}', {'status': True})
+
+        data = self.changes(self.customer, version)
+        self.assertEqual([order['id'] for order in data['results']], [order_id])
+        self.assertTrue(data['results'][0]['status'])
+        # Recent events are sent again until they leave the lookback window
+        self.assertEqual(len(self.changes(self.customer, data['version'])['results']), 1)
+        OrderEvent.objects.update(created=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.changes(self.customer, data['version'])['results'], [])
+        self.assertEqual(self.changes(self.crew[1], version)['results'], [])
+
+    def test_reassignment(self):
+        order_id = self.as_user(self.customer).post('/api/orders').data['id']
+        self.as_user(self.manager).patch(f'/api/orders/{order_id}', {'delivery_crew': self.crew[0].id})
+        version = self.changes(self.crew[0], 0)['version']
+        self.as_user(self.manager).patch(f'/api/orders/{order_id}', {'delivery_crew': self.crew[1].id})
+
+        self.assertEqual(self.changes(self.crew[0], version)['removed'], [order_id])
+        self.assertEqual(self.changes(self.crew[1], version)['results'][0]['delivery_crew'], self.crew[1].id)
+
+    def test_late_commit_is_not_missed(self):
+        order_ids = []
+        for _ in range(2):
+            Cart.objects.get_or_create(user=self.customer, menuitem=MenuItem.objects.get(), quantity=1, unit_price=10, price=10)
+            order_ids.append(self.as_user(self.customer).post('/api/orders').data['id'])
+        OrderEvent.objects.update(created=timezone.now() - timedelta(minutes=5))
+        version = self.changes(self.manager, 0)['version']
+        self.assertEqual(self.changes(self.manager, version)['results'], [])
+
+        # An event holding an id below the version commits only now
+        late = OrderEvent.objects.order_by('id').first()
+        late_id = late.id
+        late.delete()
+        late.id, late.created = late_id, timezone.now()
+        late.save()
+        data = self.changes(self.manager, version)
+        self.assertEqual([order['id'] for order in data['results']], [order_ids[0]])
+        self.assertEqual(data['version'], version)
+
+    def test_limit_and_pruned_cursor(self):
+        order_id = self.as_user(self.customer).post('/api/orders').data['id']
+        for state in (True, False, True):
+            self.as_user(self.manager).patch(f'/api/orders/{order_id}', {'status': state})
+        res = self.as_user(self.manager).get('/api/orders/changes', {'since': 0, 'limit': 2})
+        self.assertTrue(res.data['has_more'])
+        self.assertEqual(self.as_user(self.manager).get('/api/orders/changes', {'since': 'x'}).status_code, 400)
+
+        OrderEvent.objects.update(created=timezone.now() - timedelta(days=30))
+        self.assertEqual(prune_order_events(days=7), 3)
+        res = self.as_user(self.manager).get('/api/orders/changes', {'since': res.data['version']})
+        self.assertEqual(res.status_code, 410)
+
+class ReportsTestCase(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create(username='Test_user', password="Test_user")
+        self.manager = User.objects.create(username='Test_manager', password="Test_manager")
+        self.manager.groups.add(Group.objects.create(name='manager'))
+        self.crew = User.objects.create(username='Test_crew', password="Test_crew")
+        category = Category.objects.create(title="Test_category", slug="test-category")
+        self.menu_items = [MenuItem.objects.create(title=f"Test_menu_item{i}", price=10, category=category) for i in range(2)]
+        self.client = APIClient()
+
+    def place_order(self, quantities):
+        for menu_item, quantity in zip(self.menu_items, quantities):
+            Cart.objects.create(user=self.customer, menuitem=menu_item, quantity=quantity,
+                                unit_price=10, price=10 * quantity)
+        self.client.force_authenticate(user=self.customer)
+        return self.client.post('/api/orders').data['id']
+
+    def report(self, name, **params):
+        self.client.force_authenticate(user=self.manager)
+        res = self.client.get(f'/api/reports/{name}', params)
+        self.assertEqual(res.status_code, 200)
+        return res.data['results']
+
+    def snapshot(self):
+        return [self.report(name) for name in ('revenue', 'top-menu-items', 'crew-deliveries')]
+
+    def test_rollups_maintained(self):
+        order_id = self.place_order([1, 2])
+        self.place_order([3])
+        self.client.force_authenticate(user=self.manager)
+        self.client.patch(f'/api/orders/{order_id}', {'delivery_crew': self.crew.id, 'status': 'true'})
+        self.client.patch(f'/api/orders/{order_id}', {'status': 'true'})
+
+        revenue, items, crew = self.snapshot()
+        self.assertEqual(revenue, [{'date': date.today(), 'orders': 2, 'revenue': 60}])
+        self.assertEqual([(row['title'], row['total_quantity']) for row in items],
+                         [('Test_menu_item0', 4), ('Test_menu_item1', 2)])
+        self.assertEqual([(row['username'], row['total_delivered']) for row in crew], [('Test_crew', 1)])
+
+        self.client.patch(f'/api/orders/{order_id}', {'status': 'false'})
+        self.assertEqual(self.report('crew-deliveries')[0]['total_delivered'], 0)
+
+    def test_rebuild_matches_incremental(self):
+        order_id = self.place_order([2, 1])
+        self.place_order([1, 1])
+        self.client.force_authenticate(user=self.manager)
+        self.client.patch(f'/api/orders/{order_id}', {'delivery_crew': self.crew.id, 'status': True})
+        incremental = self.snapshot()
+        self.assertEqual(rebuild_rollups(chunk_days=1), 1)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_permissions_and_range(self):
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get('/api/reports/revenue').status_code, 403)
+        self.client.force_authenticate(user=self.manager)
+        self.assertEqual(self.client.get('/api/reports/revenue', {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/reports/revenue', {'start': '2024-02-01', 'end': '2024-01-01'}).status_code, 400)
+
+@override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': False})
+class OrderBatchUpdateTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(username='Test_user')
+        self.manager = User.objects.create(username='Test_manager')
+        self.manager.groups.add(Group.objects.create(name='manager'))
+        self.crew = [User.objects.create(username=f'Test_crew{i}') for i in range(2)]
+        Group.objects.create(name='delivery_crew').user_set.add(*self.crew)
+        self.orders = [Order.objects.create(user=self.customer, total=10,
+                                            date=date.today() - timedelta(days=i % 2)) for i in range(4)]
+        self.client = APIClient()
+
+    def batch(self, user, data):
+        self.client.force_authenticate(user=user)
+        return self.client.post(reverse('orders_batch'), data, format='json')
+
+    def test_assign_and_deliver(self):
+        ids = [order.id for order in self.orders[:3]]
+        res = self.batch(self.manager, {'orders': ids + [0], 'delivery_crew': self.crew[0].id})
+        self.assertEqual(res.status_code, 400)
+        res = self.batch(self.manager, {'orders': ids + [999], 'delivery_crew': self.crew[0].id})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([row['result'] for row in res.data['results']], ['updated'] * 3 + ['not_found'])
+        self.assertEqual(Order.objects.filter(delivery_crew=self.crew[0]).count(), 3)
+
+        res = self.batch(self.crew[0], {'orders': [ids[0], self.orders[3].id], 'status': True})
+        self.assertEqual([row['result'] for row in res.data['results']], ['updated', 'not_found'])
+        res = self.batch(self.crew[0], {'orders': ids[:2], 'status': True})
+        self.assertEqual([row['result'] for row in res.data['results']], ['unchanged', 'updated'])
+
+        # Reassigning moves the deliveries and unassigns from the old crew's feed
+        res = self.batch(self.manager, {'orders': ids, 'delivery_crew': self.crew[1].id})
+        self.assertEqual(OrderEvent.objects.filter(kind='unassigned', delivery_crew=self.crew[0]).count(), 3)
+        self.assertEqual(OrderEvent.objects.filter(order_id=ids[0]).count(), 4)
+        incremental = list(DailyCrewDeliveries.objects.filter(delivered__gt=0).values_list('date', 'delivery_crew_id', 'delivered'))
+        self.assertEqual(sum(row[2] for row in incremental), 2)
+        rebuild_rollups()
+        self.assertEqual(
+            sorted(DailyCrewDeliveries.objects.filter(delivered__gt=0).values_list('date', 'delivery_crew_id', 'delivered')),
+            sorted(incremental))
+
+    def test_permissions_and_validation(self):
+        ids = [order.id for order in self.orders]
+        self.assertEqual(self.batch(self.customer, {'orders': ids, 'status': True}).status_code, 403)
+        self.assertEqual(self.batch(self.crew[0], {'orders': ids, 'delivery_crew': self.crew[0].id}).status_code, 403)
+        self.assertEqual(self.batch(self.manager, {'orders': ids, 'delivery_crew': self.customer.id}).status_code, 400)
+        self.assertEqual(self.batch(self.manager, {'orders': ids}).status_code, 400)
+        self.assertEqual(self.batch(self.manager, {'orders': [], 'status': True}).status_code, 400)
+
+    def test_queries_do_not_grow_with_orders(self):
+        def update(orders, crew):
+            with CaptureQueriesContext(connection) as queries:
+                self.batch(self.manager, {'orders': [order.id for order in orders], 'delivery_crew': crew.id, 'status': True})
+            return len(queries)
+        self.batch(self.manager, {'orders': [self.orders[0].id], 'status': False})
+        self.assertEqual(update(self.orders[:2], self.crew[0]), update(self.orders, self.crew[1]))
+
+class DispatcherTestCase(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.customer = User.objects.create(username='Test_user')
+        self.crew = [User.objects.create(username=f'Test_crew{i}') for i in range(3)]
+        Group.objects.create(name='delivery_crew').user_set.add(*self.crew)
+        # crew 0 already has two open orders, crew 1 a delivered one
+        Order.objects.create(user=self.customer, total=10, delivery_crew=self.crew[0])
+        Order.objects.create(user=self.customer, total=10, delivery_crew=self.crew[0])
+        Order.objects.create(user=self.customer, total=10, delivery_crew=self.crew[1], status=True)
+        self.orders = [Order.objects.create(user=self.customer, total=10) for _ in range(7)]
+
+    def open_orders(self):
+        return dict(Order.objects.filter(status=False).values_list('delivery_crew').annotate(count=Count('id')))
+
+    def test_balances_open_orders(self):
+        report = dispatcher.dispatch(batch_size=3)
+        self.assertEqual((report['batches'], report['orders']), (3, 7))
+        self.assertEqual(self.open_orders(), {self.crew[0].id: 3, self.crew[1].id: 3, self.crew[2].id: 3})
+        self.assertEqual(OrderEvent.objects.filter(delivery_crew__in=self.crew).count(), 7)
+        self.assertIn('simplehub_dispatched_orders_total 7', metrics.registry.render())
+        self.assertEqual(dispatcher.dispatch()['orders'], 0)
+
+    def test_skips_inactive_crew_and_assigned_orders(self):
+        self.crew[2].is_active = False
+        self.crew[2].save()
+        self.orders[0].delivery_crew = self.crew[2]
+        self.orders[0].save()
+        self.assertEqual(dispatcher.dispatch_batch(), (6, 6))
+        self.assertEqual(self.open_orders(), {self.crew[0].id: 4, self.crew[1].id: 4, self.crew[2].id: 1})
+
+    def test_keeps_draining_after_a_lost_batch(self):
+        # The first batch only finds an order assigned by hand meanwhile
+        original, calls = dispatcher.update_orders, []
+        def assign_elsewhere(orders, ids, **changes):
+            if not calls:
+                Order.objects.filter(id__in=ids).update(delivery_crew=self.crew[2])
+            calls.append(ids)
+            return original(orders, ids, **changes)
+        with patch.object(dispatcher, 'update_orders', assign_elsewhere):
+            report = dispatcher.dispatch(batch_size=1)
+        self.assertEqual((report['batches'], report['orders']), (7, 6))
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+
+    def test_metrics_server(self):
+        metrics.dispatched_orders.inc(3)
+        server = metrics.serve(0)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+                self.assertIn('simplehub_dispatched_orders_total 3', response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('dispatch_orders', '--batch-size', '5', '--max-batches', '1', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['orders'], 5)
+        self.assertEqual(Order.objects.filter(delivery_crew__isnull=True).count(), 2)
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(username='Test_user')
+        self.manager = User.objects.create(username='Test_manager')
+        self.manager.groups.add(Group.objects.create(name='manager'))
+        self.crew = User.objects.create(username='Test_crew')
+        self.crew.groups.add(Group.objects.create(name='delivery_crew'))
+        menu_item = MenuItem.objects.create(title='Test_menu_item', price=10, category=Category.objects.create(title='Test_category'))
+        self.orders = []
+        for days, delivered in [(400, True), (300, True), (300, False), (10, True)]:
+            order = Order.objects.create(user=self.customer, delivery_crew=self.crew, status=delivered, total=20,
+                                         date=date.today() - timedelta(days=days))
+            OrderItem.objects.create(order=order, menuitem=menu_item, quantity=2, price=20)
+            self.orders.append(order)
+        rebuild_rollups()
+        self.client = APIClient()
+
+    def list_ids(self, user, **params):
+        self.client.force_authenticate(user=user)
+        res = self.client.get('/api/orders', params)
+        self.assertEqual(res.status_code, 200)
+        return [order['id'] for order in res.data['results']]
+
+    def test_archive_old_delivered_orders(self):
+        # Orders still in the change feed wait for the events to be pruned
+        OrderEvent.objects.create(order=self.orders[1], user=self.customer, kind='updated')
+        self.assertEqual(archive.archive_orders(days=180, batch_size=1), 1)
+        OrderEvent.objects.all().delete()
+        self.assertEqual(archive.archive_orders(days=180, batch_size=1), 1)
+
+        archived = [self.orders[0].id, self.orders[1].id]
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('id', flat=True)), archived)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 2)
+        self.assertFalse(Order.objects.filter(id__in=archived).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id__in=archived).exists())
+        self.assertEqual(archive.archive_orders(days=180), 0)
+
+    def test_include_archived(self):
+        archive.archive_orders(days=180)
+        newest_first = [self.orders[3].id, self.orders[2].id, self.orders[1].id, self.orders[0].id]
+        self.assertEqual(set(self.list_ids(self.manager)), {self.orders[3].id, self.orders[2].id})
+        self.assertEqual(self.list_ids(self.manager, include_archived='true'), newest_first)
+        self.assertEqual(self.list_ids(self.customer, include_archived=''), newest_first)
+        self.assertEqual(self.list_ids(User.objects.create(username='Test_other'), include_archived=1), [])
+
+        self.client.force_authenticate(user=self.crew)
+        res = self.client.get('/api/orders', {'include_archived': 'true'})
+        self.assertEqual(res.data['count'], 4)
+        archived = res.data['results'][2]
+        self.assertEqual(archived['delivery_crew'], {'id': self.crew.id, 'username': 'Test_crew'})
+        self.assertEqual(archived['order_items'], [{'order': self.orders[1].id, 'menuitem': MenuItem.objects.get().id,
+                                                    'quantity': 2, 'price': '20.00'}])
+        self.assertEqual(self.client.get('/api/orders', {'include_archived': 'true', 'cursor': ''}).status_code, 400)
+        self.assertEqual(self.client.get('/api/orders', {'include_archived': 'maybe'}).status_code, 400)
+
+    def test_archived_detail_summary_and_export(self):
+        archive.archive_orders(days=180)
+        archived_id = self.orders[0].id
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get(f'/api/orders/{archived_id}').status_code, 404)
+        hot = self.client.get(f'/api/orders/{self.orders[2].id}').data
+        res = self.client.get(f'/api/orders/{archived_id}', {'include_archived': 'true'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(list(res.data), list(hot))
+        self.assertEqual(res.data['orderitem'][0]['quantity'], 2)
+        self.client.force_authenticate(user=User.objects.create(username='Test_other'))
+        self.assertEqual(self.client.get(f'/api/orders/{archived_id}', {'include_archived': 'true'}).status_code, 404)
+
+        self.client.force_authenticate(user=self.manager)
+        res = self.client.get('/api/orders', {'include_archived': 'true', 'view': 'summary'})
+        self.assertEqual(res.data['count'], 4)
+        self.assertEqual(res.data['results'][3], {
+            'id': archived_id, 'user': self.customer.id, 'delivery_crew': self.crew.id, 'status': True,
+            'date': self.orders[0].date.isoformat(), 'total': '20.00', 'item_count': 0, 'item_titles': []})
+
+        with override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': False}):
+            exported = lambda **params: [
+                json.loads(line)['order'] for line in b''.join(self.client.get(
+                    reverse('orders_export'), {'file_format': 'jsonl', **params}).streaming_content).decode().splitlines()]
+            self.assertEqual(exported(), [self.orders[2].id, self.orders[3].id])
+            self.assertEqual(exported(include_archived='true'), [self.orders[2].id, self.orders[3].id, self.orders[0].id, self.orders[1].id])
+
+    def test_rollups_survive_archiving(self):
+        before = [list(model.objects.order_by('id').values()) for model in (DailySales, DailyCrewDeliveries)]
+        archive.archive_orders(days=180)
+        rebuild_rollups()
+        after = [list(model.objects.order_by('date').values()) for model in (DailySales, DailyCrewDeliveries)]
+        strip = lambda rows: sorted((tuple(v for k, v in row.items() if k != 'id') for row in rows), key=str)
+        self.assertEqual([strip(rows) for rows in after], [strip(rows) for rows in before])
+
+class FastListTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        self.crew = User.objects.create(username='Test_crew', password="Test_crew")
+        for i in range(3):
+            category = Category.objects.create(title=f"Test_category{i}", slug=f"test-category{i}")
+            menu_item = MenuItem.objects.create(
+                title=f"Test_menu_item{i}\u2028", price=f'{i}.5', category=category,
+                featured=i == 1, description=None if i else 'Desc')
+            order = Order.objects.create(user=self.user, delivery_crew=self.crew if i else None, total=f'1{i}.25')
+            for quantity in range(i):
+                other = MenuItem.objects.create(title=f"Test_other{i}_{quantity}", price=3, category=category)
+                OrderItem.objects.create(order=order, menuitem=other, quantity=quantity + 1, price='3.10')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_rows_match_serializers(self):
+        menu_items = MenuItem.objects.order_by('id')
+        self.assertEqual(
+            fastpath.MenuItemRows().build(list(menu_items.values(*fastpath.MenuItemRows.values))),
+            serializers.MenuItemSerializer(menu_items, many=True).data)
+        orders = Order.objects.order_by('id')
+        self.assertEqual(
+            fastpath.OrderRows().build(list(orders.values(*fastpath.OrderRows.values))),
+            serializers.OrderSerializer(orders, many=True).data)
+        self.assertEqual(fastpath.OrderRows().build([]), [])
+
+    def assertSameResponses(self, *urls):
+        for url in urls:
+            cache.clear()
+            slow = self.client.get(url)
+            cache.clear()
+            with override_settings(FAST_LIST_RENDERING=True):
+                fast = self.client.get(url)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content, slow.content)
+
+    def test_responses_match(self):
+        self.assertSameResponses(
+            '/api/menu-items', '/api/menu-items?ordering=-price&page=1', '/api/menu-items?search=category1',
+            '/api/menu-items?cursor=', '/api/orders', '/api/orders?cursor=&page_size=2', '/api/orders?view=summary')
+
+    def test_query_count_unchanged(self):
+        for url, num in (('/api/menu-items', 2), ('/api/orders', 3)):
+            self.client.get(url)
+            bump_catalog_version()
+            with override_settings(FAST_LIST_RENDERING=True), self.assertNumQueries(num):
+                self.client.get(url)
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRoutingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        self.other = User.objects.create(username='Test_other', password="Test_other")
+        self.factory = RequestFactory()
+
+    def route(self, method, user=None, status=200):
+        # Where an Order read goes before and after authentication
+        seen = []
+        def view(request):
+            seen.append(router.db_for_read(Order))
+            if user is not None:
+                request.user = user
+            seen.append(router.db_for_read(Order))
+            return HttpResponse(status=status)
+        ReplicaRoutingMiddleware(view)(getattr(self.factory, method)('/api/orders'))
+        return seen
+
+    def test_safe_reads_use_one_replica(self):
+        first, second = self.route('get', self.user)
+        self.assertIn(first, ['replica1', 'replica2'])
+        self.assertEqual(first, second)
+        self.assertEqual(self.route('post', self.user), ['default', 'default'])
+        self.assertEqual(router.db_for_read(Order), 'default')
+
+    def test_read_your_writes(self):
+        self.route('post', self.user, status=400)
+        self.assertNotEqual(self.route('get', self.user)[1], 'default')
+        self.route('post', self.user, status=201)
+        self.assertEqual(self.route('get', self.user)[1], 'default')
+        self.assertNotEqual(self.route('get', self.other)[1], 'default')
+
+    def test_primary_only_cases(self):
+        with use_primary():
+            self.assertEqual(router.db_for_read(Order), 'default')
+        def view(request):
+            return HttpResponse(router.db_for_read(Session))
+        self.assertEqual(ReplicaRoutingMiddleware(view)(self.factory.get('/')).content, b'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.route('get'), ['default', 'default'])
+
+    async def test_async_requests(self):
+        seen = []
+        async def view(request):
+            request.user = self.user
+            seen.append(router.db_for_read(Order))
+            return HttpResponse(status=201)
+        middleware = ReplicaRoutingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        for method in ['get', 'post', 'get']:
+            await middleware(getattr(AsyncRequestFactory(), method)('/api/orders'))
+        self.assertIn(seen[0], ['replica1', 'replica2'])
+        self.assertEqual(seen[1:], ['default', 'default'])
+        self.assertEqual(router.db_for_read(Order), 'default')
+
+    def test_fresh_catalog_versions_read_from_primary(self):
+        self.assertTrue(is_fresh(bump_catalog_version()))
+        self.assertFalse(is_fresh(bump_catalog_version() - 60 * 1000))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertFalse(is_fresh(bump_catalog_version()))
+
+class MenuSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title="Mains", slug="mains")
+        self.other_category = Category.objects.create(title="Sides", slug="sides")
+        self.item = lambda title, **kwargs: MenuItem.objects.create(
+            title=title, price=kwargs.pop('price', 10), category=kwargs.pop('category', self.category), **kwargs)
+        self.item("Chicken Salad", description="Grilled chicken", featured=True, price=12)
+        self.item("Caesar Salad", description="Romaine, no chicken", price=8)
+        self.item("Chickpea Curry", description="Spicy", category=self.other_category, price=9)
+        self.item("Lemonade", description=None)
+        self.client = APIClient()
+
+    def titles(self, **params):
+        res = self.client.get('/api/menu-items/search', params)
+        self.assertEqual(res.status_code, 200)
+        return [item['title'] for item in res.data['results']]
+
+    def test_ranked_prefix_search(self):
+        titles = self.titles(q='chick')
+        # title matches rank above description matches
+        self.assertEqual(set(titles[:2]), {'Chicken Salad', 'Chickpea Curry'})
+        self.assertEqual(titles[2:], ['Caesar Salad'])
+        self.assertEqual(self.titles(q='chicken sal'), ['Chicken Salad', 'Caesar Salad'])
+        self.assertEqual(self.titles(q='ROMAINE'), ['Caesar Salad'])
+        self.assertEqual(self.titles(q='"*'), [])
+
+    def test_filters(self):
+        self.assertEqual(self.titles(q='chick', featured='true'), ['Chicken Salad'])
+        self.assertEqual(self.titles(q='chick', max_price='9.00'), ['Chickpea Curry', 'Caesar Salad'])
+        self.assertEqual(self.titles(q='chick', min_price=9, category='sides'), ['Chickpea Curry'])
+        self.assertEqual(self.client.get('/api/menu-items/search', {'q': 'chick', 'min_price': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/menu-items/search').status_code, 400)
+
+    def test_index_follows_writes(self):
+        item = MenuItem.objects.get(title="Lemonade")
+        item.title = "Pink Lemonade"
+        item.save()
+        self.assertEqual(self.titles(q='pink'), ['Pink Lemonade'])
+        item.delete()
+        self.assertEqual(self.titles(q='lemonade'), [])
+        MenuItem.objects.bulk_create([MenuItem(title="Iced Tea", price=3, category=self.category)])
+        MenuItem.objects.filter(title="Iced Tea").update(description="Peach")
+        self.assertEqual(self.titles(q='peach'), ['Iced Tea'])
+
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        category = Category.objects.create(title="Test_category", slug="test-category")
+        self.menu_items = [MenuItem.objects.create(title=f"Test_menu_item{i}", price=10, category=category) for i in range(2)]
+        Cart.objects.create(user=self.user, menuitem=self.menu_items[0], quantity=1, unit_price=10, price=10)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_checkout_retry_replays(self):
+        first = self.post('/api/orders', {}, 'order-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.post('/api/orders', {}, 'order-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.assertEqual(self.post('/api/orders', {'status': True}, 'order-1').status_code, 422)
+        self.assertEqual(self.post('/api/orders', {}, 'order-2').data['message'], 'Cart is empty')
+
+    def test_errors_are_not_stored(self):
+        res = self.post('/api/cart/menu-items', {'menuitem': self.menu_items[1].id, 'quantity': 0}, 'cart-1')
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        res = self.post('/api/cart/menu-items', {'menuitem': self.menu_items[1].id, 'quantity': 2}, 'cart-1')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.post('/api/cart/menu-items', {'menuitem': self.menu_items[1].id, 'quantity': 2}, 'cart-1').status_code, 201)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_cart_batch_and_expiry(self):
+        batch = {'upsert': [{'menuitem': self.menu_items[1].id, 'quantity': 1}]}
+        self.client.patch('/api/cart/menu-items', batch, format='json', HTTP_IDEMPOTENCY_KEY='batch')
+        Cart.objects.filter(menuitem=self.menu_items[1]).delete()
+        res = self.client.patch('/api/cart/menu-items', batch, format='json', HTTP_IDEMPOTENCY_KEY='batch')
+        self.assertEqual(len(res.data), 2)
+        self.assertFalse(Cart.objects.filter(menuitem=self.menu_items[1]).exists())
+
+        IdempotencyKey.objects.update(created=timezone.now() - timedelta(days=2))
+        self.client.patch('/api/cart/menu-items', batch, format='json', HTTP_IDEMPOTENCY_KEY='batch')
+        self.assertTrue(Cart.objects.filter(menuitem=self.menu_items[1]).exists())
+        self.post('/api/orders', {}, 'order')
+        IdempotencyKey.objects.filter(key='order').update(created=timezone.now() - timedelta(days=2))
+        self.assertEqual(prune_idempotency_keys(), 1)
+
+class ThrottlingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.users = [User.objects.create(username=f'Test_user{i}', password="Test_user") for i in range(2)]
+        self.client = APIClient()
+
+    def get(self, user, url='/api/menu-items/counts'):
+        self.client.force_authenticate(user=user)
+        return self.client.get(url)
+
+    @override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': True, 'ROUTES': {'menu_items_counts': (0.01, 2)}})
+    def test_route_bucket_per_user(self):
+        self.assertEqual([self.get(self.users[0]).status_code for _ in range(3)], [200, 200, 429])
+        res = self.get(self.users[0])
+        self.assertGreater(int(res['Retry-After']), 1)
+        self.assertEqual(self.get(self.users[1]).status_code, 200)
+        self.assertEqual(self.get(self.users[0], '/api/menu-items').status_code, 200)
+        rendered = metrics.registry.render()
+        self.assertIn('simplehub_throttle_decisions_total{decision="throttled",route="menu_items_counts"} 2', rendered)
+        self.assertIn('simplehub_throttle_decisions_total{decision="allowed",route="menu_items_counts"} 3', rendered)
+
+    @override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': True, 'USER': (0.01, 2)})
+    def test_user_bucket_across_routes(self):
+        self.assertEqual(self.get(self.users[0], '/api/menu-items').status_code, 200)
+        self.assertEqual(self.get(self.users[0], '/api/categories').status_code, 200)
+        self.assertEqual(self.get(self.users[0]).status_code, 429)
+        with override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': False}):
+            self.assertEqual(self.get(self.users[0]).status_code, 200)
+
+    @override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': True, 'MAX_IN_FLIGHT': 1})
+    def test_concurrency_limit_sheds(self):
+        # The inner request arrives while the outer one holds the only slot
+        responses = []
+        def view(request):
+            if request.path == '/api/menu-items':
+                responses.append(middleware(RequestFactory().get('/api/orders')))
+                responses.append(middleware(RequestFactory().get('/metrics')))
+            return HttpResponse()
+        middleware = AdmissionControlMiddleware(view)
+        self.assertEqual(middleware(RequestFactory().get('/api/menu-items')).status_code, 200)
+        self.assertEqual(responses[0].status_code, 503)
+        self.assertEqual(responses[0]['Retry-After'], '1')
+        self.assertEqual(responses[1].status_code, 200)
+        self.assertIn('simplehub_shed_requests_total{route="orders"} 1', metrics.registry.render())
+
+    @override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': True, 'MAX_IN_FLIGHT': 1})
+    async def test_concurrency_limit_sheds_async(self):
+        responses = []
+        async def view(request):
+            if request.path == '/api/menu-items':
+                responses.append(await middleware(AsyncRequestFactory().get('/api/orders')))
+            return HttpResponse()
+        middleware = AdmissionControlMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertEqual((await middleware(AsyncRequestFactory().get('/api/menu-items'))).status_code, 200)
+        self.assertEqual(responses[0].status_code, 503)
+        self.assertEqual((await middleware(AsyncRequestFactory().get('/api/orders'))).status_code, 200)
+
+# Stateless routes need a shared revocation cache, a file cache stands in for Redis
+STATELESS_SETTINGS = {
+    'CACHES': {**settings.CACHES, 'revocation': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='simplehub-test-revocation'),
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    }},
+    'STATELESS_JWT_ROUTES': {
+        'categories', 'menu_items', 'menu_item', 'menu_items_counts', 'menu_items_search',
+        'cart', 'cart_item', 'orders', 'order', 'order_changes',
+    },
+}
+
+
+@override_settings(**STATELESS_SETTINGS)
+class StatelessJWTTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.revocation_cache().clear()
+        self.user = User.objects.create_user(username='Test_user', password="Test_password")
+        self.admin = User.objects.create(username='Test_admin', is_superuser=True)
+        self.client = APIClient()
+
+    def login(self, username='Test_user', password='Test_password'):
+        res = self.client.post('/auth/jwt/create/', {'username': username, 'password': password})
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + res.data['access'])
+        return res.data
+
+    def login_earlier(self):
+        # Revocations keep tokens from their own second
+        with patch('time.time', return_value=time.time() - 1):
+            return self.login()
+
+    def test_stateless_route_skips_user_query(self):
+        self.login()
+        self.client.get('/api/orders')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/orders')
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse([q for q in queries if 'FROM "auth_user" WHERE' in q['sql']])
+
+        Cart.objects.create(user=self.user, menuitem=MenuItem.objects.create(
+            title='Test_menu_item', price=10, category=Category.objects.create(title='Test_category')),
+            quantity=1, unit_price=10, price=10)
+        res = self.client.post('/api/orders')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(Order.objects.get().user, self.user)
+
+    def test_other_routes_load_user(self):
+        access = AccessToken.for_user(self.admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {access}')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/groups/delivery-crew/users')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue([q for q in queries if 'FROM "auth_user" WHERE' in q['sql']])
+
+    def test_revoked_token(self):
+        access = self.login()['access']
+        self.assertEqual(self.client.get('/api/orders').status_code, 200)
+        authentication.revoke_token(AccessToken(access))
+        res = self.client.get('/api/orders')
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(res.data['detail'].code, 'token_revoked')
+
+    def test_deactivated_user(self):
+        self.login_earlier()
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 403)
+
+        self.user.is_active = True
+        self.user.save()
+        self.login()
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 200)
+
+    def test_refreshed_token_keeps_login_time(self):
+        tokens = self.login_earlier()
+        authentication.revoke_user_tokens(self.user.pk)
+        res = self.client.post('/auth/jwt/refresh/', {'refresh': tokens['refresh']})
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + res.data['access'])
+        self.assertEqual(self.client.get('/api/orders').status_code, 403)
+
+    def test_local_revocation_cache_loads_user(self):
+        with override_settings(CACHES={**settings.CACHES, 'revocation': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([e.id for e in authentication.check_revocation_cache(None)], ['api.W001'])
+            self.login()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get('/api/orders').status_code, 200)
+            self.assertTrue([q for q in queries if 'FROM "auth_user" WHERE' in q['sql']])
+            self.user.is_active = False
+            self.user.save()
+            self.assertEqual(self.client.get('/api/orders').status_code, 403)
+        self.assertEqual(authentication.check_revocation_cache(None), [])
+
+
+class ListQueryCountTestCase(TestCase):
+    page_size = 12
+
+    def setUp(self):
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        self.crew = User.objects.create(username='Test_crew', password="Test_crew")
+        self.seeded = 0
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def seed(self, n):
+        for i in range(self.seeded, self.seeded + n):
+            with self.captureOnCommitCallbacks(execute=True):
+                category = Category.objects.create(title=f"Test_category{i}", slug=f"test-category{i}")
+                menu_item = MenuItem.objects.create(title=f"Test_menu_item{i}", price = 10, category = category)
+            Cart.objects.create(user=self.user, menuitem=menu_item, quantity=1, unit_price=10, price=10)
+            order = Order.objects.create(user=self.user, delivery_crew=self.crew, total=20)
+            OrderItem.objects.create(order=order, menuitem=menu_item, quantity=2, price=20)
+        self.seeded += n
+
+    def assertConstantQueries(self, url, num):
+        # Same number of queries for a single row and for a full page, caches warm
+        self.client.get(url)
+        self.seed(1)
+        with self.assertNumQueries(num):
+            self.client.get(url)
+        self.seed(self.page_size)
+        with self.assertNumQueries(num):
+            res = self.client.get(url)
+        self.assertEqual(len(res.data['results']), self.page_size)
+        return res
+
+    def test_menu_items(self):
+        res = self.assertConstantQueries(reverse('menu_items'), 2)
+        self.assertTrue(res.data['results'][0]['category_name'].startswith('Test_category'))
+
+    def test_cart(self):
+        res = self.assertConstantQueries('/api/cart/menu-items', 2)
+        self.assertEqual(res.data['results'][0]['menuitem_name'], 'Test_menu_item0')
+
+    def test_orders(self):
+        res = self.assertConstantQueries('/api/orders', 3)
+        self.assertEqual(res.data['results'][0]['delivery_crew']['username'], 'Test_crew')
+        self.assertEqual(len(res.data['results'][0]['order_items']), 1)
+
+    def test_orders_summary(self):
+        self.assertConstantQueries('/api/orders?view=summary', 2)
+
+@override_settings(**STATELESS_SETTINGS)
+class RolesTestCase(TestCase):
+    def setUp(self):
+        authentication.revocation_cache().clear()
+        self.admin = User.objects.create(username='Test_admin', is_superuser=True)
+        self.user = User.objects.create_user(username='Test_user', password="Test_password")
+        self.delivery_crew = Group.objects.create(name='delivery_crew')
+        self.client = APIClient()
+
+    def test_roles_loaded_once(self):
+        self.user.groups.add(self.delivery_crew)
+        self.client.force_authenticate(user=self.user)
+        self.client.get('/api/orders')
+        with self.assertNumQueries(1):
+            self.client.get('/api/orders')
+
+    def test_roles_invalidated_on_group_change(self):
+        Order.objects.create(user=self.admin, total=10)
+        self.client.force_authenticate(user=self.user)
+        self.client.get('/api/orders')
+
+        self.client.force_authenticate(user=self.admin)
+        res = self.client.post('/api/groups/delivery-crew/users', {'username': 'Test_user'})
+        self.assertEqual(res.status_code, 200)
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(User.objects.get(pk=self.user.pk).groups.get().name, 'delivery_crew')
+        res = self.client.get('/api/orders')
+        self.assertEqual(res.data['count'], 0)
+        with self.assertNumQueries(1):
+            self.client.get('/api/orders')
+
+    def test_roles_from_token(self):
+        self.user.groups.add(self.delivery_crew)
+        res = self.client.post('/auth/jwt/create/', {'username': 'Test_user', 'password': 'Test_password'})
+        self.assertEqual(AccessToken(res.data['access'])['roles'], ['delivery_crew'])
+
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + res.data['access'])
+        cache.clear()
+        with override_settings(ROLES_FROM_TOKEN=True):
+            # order count only, no user or group query
+            with self.assertNumQueries(1):
+                res = self.client.get('/api/orders')
+        self.assertEqual(res.status_code, 200)
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title="Test_category", slug="test-category")
+        self.menu_item = MenuItem.objects.create(title="Test_menu_item", price = 10, category = self.category)
+        self.client = APIClient()
+
+    def test_menu_items_cached(self):
+        url = reverse('menu_items')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            res = self.client.get(url)
+        self.assertEqual(res.data['results'][0]['title'], 'Test_menu_item')
+
+        # Not bumped before the change commits, a read now would still see
+        # the old rows
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item.title = 'Test_menu_item_renamed'
+            self.menu_item.save()
+            self.assertEqual(self.client.get(url).data['results'][0]['title'], 'Test_menu_item')
+        res = self.client.get(url)
+        self.assertEqual(res.data['results'][0]['title'], 'Test_menu_item_renamed')
+
+    def test_single_item_and_counts_cached(self):
+        for url in [f'/api/menu-items/{self.menu_item.id}', reverse('menu_items_counts')]:
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(title="Test_menu_item2", price = 10, category = self.category)
+        res = self.client.get(reverse('menu_items_counts'))
+        self.assertEqual(res.data['counts'], 2)
+
+    def test_not_modified(self):
+        url = reverse('categories')
+        res = self.client.get(url)
+        etag = res['ETag']
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(title="Test_category2", slug="test-category2")
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        self.category = Category.objects.create(title="Test_category", slug="test-category")
+        for i in range(30):
+            menu_item = MenuItem.objects.create(title=f"Test_menu_item{i}", price = 10 + i % 3, category = self.category)
+            Order.objects.create(user=self.user, total=10, date=date(2024, 1, 1 + i % 5))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('count', res.data)
+            pages.append(url)
+            ids += [row['id'] for row in res.data['results']]
+            url = res.data['next']
+        return ids, pages
+
+    def test_menu_items_cursor(self):
+        ids, pages = self.walk(reverse('menu_items') + '?cursor=')
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(ids), sorted(MenuItem.objects.values_list('id', flat=True)))
+        self.assertEqual(ids, list(MenuItem.objects.order_by('price', 'id').values_list('id', flat=True)))
+
+        res = self.client.get(pages[-1])
+        res = self.client.get(res.data['previous'])
+        self.assertEqual([row['id'] for row in res.data['results']], ids[12:24])
+
+    def test_menu_items_cursor_with_ordering(self):
+        ids, pages = self.walk(reverse('menu_items') + '?ordering=-price&cursor=')
+        self.assertEqual(ids, list(MenuItem.objects.order_by('-price', '-id').values_list('id', flat=True)))
+
+    def test_orders_cursor(self):
+        ids, pages = self.walk('/api/orders?cursor=')
+        self.assertEqual(ids, list(Order.objects.order_by('-date', '-id').values_list('id', flat=True)))
+        # page and prefetched items, no COUNT(*)
+        with self.assertNumQueries(2):
+            self.client.get(pages[-1])
+
+    def test_cart_cursor(self):
+        for menu_item in MenuItem.objects.all():
+            Cart.objects.create(user=self.user, menuitem=menu_item, quantity=1, unit_price=10, price=10)
+        ids, pages = self.walk('/api/cart/menu-items?cursor=')
+        self.assertEqual(ids, list(Cart.objects.order_by('menuitem__title', 'id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        res = self.client.get('/api/orders?cursor=bogus')
+        self.assertEqual(res.status_code, 404)
+        cursor = urlsafe_b64encode(json.dumps({'o': ['-date', '-id'], 'p': ['x', 1], 'r': False}).encode()).decode()
+        res = self.client.get('/api/orders', {'cursor': cursor})
+        self.assertEqual(res.status_code, 404)
+
+    def test_page_numbers_by_default(self):
+        res = self.client.get('/api/orders')
+        self.assertEqual(res.data['count'], 30)
+
+class MenuItemCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.starters = Category.objects.create(title="Starters", slug="starters")
+        self.mains = Category.objects.create(title="Mains", slug="mains")
+        for i in range(5):
+            MenuItem.objects.create(title=f"Test_menu_item{i}", price = 10, category = self.starters)
+        self.client = APIClient()
+        self.urls = reverse('menu_items_counts')
+
+    def counts(self):
+        return dict(MenuItemCount.objects.values_list('category__slug', 'count'))
+
+    def test_counters_maintained(self):
+        self.assertEqual(self.counts(), {'starters': 5, 'mains': 0})
+
+        menu_item = MenuItem.objects.get(title="Test_menu_item0")
+        menu_item.category = self.mains
+        menu_item.save()
+        self.assertEqual(self.counts(), {'starters': 4, 'mains': 1})
+
+        menu_item.delete()
+        self.assertEqual(self.counts(), {'starters': 4, 'mains': 0})
+
+        MenuItemCount.objects.update(count=0)
+        rebuild_menu_item_counts()
+        self.assertEqual(self.counts(), {'starters': 4, 'mains': 0})
+
+    def test_counts_per_category(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(self.urls, {'page_size': 2})
+        self.assertEqual(res.data['counts'], 5)
+        self.assertEqual(res.data['total_pages'], 3)
+        self.assertEqual(
+            [(category['slug'], category['counts'], category['total_pages']) for category in res.data['categories']],
+            [('mains', 0, 0), ('starters', 5, 3)])
+
+        res = self.client.get(self.urls, {'category': 'starters'})
+        self.assertEqual(res.data, {'counts': 5, 'total_pages': 1})
+
+        res = self.client.get(self.urls, {'page_size': 0})
+        self.assertEqual(res.status_code, 400)
+
+class SeedTestCase(TestCase):
+    def test_seed(self):
+        counts = seed(categories=3, menu_items=20, users=5, delivery_crew=2, carts=2, orders=30, items_per_order=2, batch_size=7)
+        self.assertEqual(counts['orders'], 30)
+        self.assertEqual(MenuItem.objects.count(), 20)
+        self.assertEqual(Cart.objects.count(), 4)
+        self.assertEqual(OrderItem.objects.count(), 60)
+        self.assertEqual(User.objects.filter(groups__name='delivery_crew').count(), 2)
+        self.assertEqual(sum(MenuItemCount.objects.values_list('count', flat=True)), 20)
+
+class CartBatchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='Test_user', password="Test_user")
+        self.category = Category.objects.create(title="Test_category", slug="test-category")
+        self.menu_items = [
+            MenuItem.objects.create(title=f"Test_menu_item{i}", price = 10 + i, category = self.category)
+            for i in range(15)
+        ]
+        Cart.objects.create(user=self.user, menuitem=self.menu_items[0], quantity=1, unit_price=10, price=10)
+        Cart.objects.create(user=self.user, menuitem=self.menu_items[1], quantity=1, unit_price=11, price=11)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.urls = '/api/cart/menu-items'
+
+    def test_batch_upsert_and_remove(self):
+        upsert = [{'menuitem': menu_item.id, 'quantity': 2} for menu_item in self.menu_items if menu_item != self.menu_items[1]]
+        # prices, savepoint, upsert, delete, release, cart
+        with self.assertNumQueries(6):
+            res = self.client.patch(self.urls, {'upsert': upsert, 'remove': [self.menu_items[1].id]}, format='json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.data), 14)
+        line = Cart.objects.get(user=self.user, menuitem=self.menu_items[0])
+        self.assertEqual((line.quantity, float(line.price)), (2, 20))
+        self.assertFalse(Cart.objects.filter(menuitem=self.menu_items[1]).exists())
+
+    def test_batch_validation(self):
+        res = self.client.patch(self.urls, {'upsert': [
+            {'menuitem': self.menu_items[2].id, 'quantity': 1},
+            {'menuitem': self.menu_items[3].id, 'quantity': 0},
+            {'menuitem': 0, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.data['upsert'][0], {})
+        self.assertIn('non_field_errors', res.data['upsert'][1])
+        self.assertIn('menuitem', res.data['upsert'][2])
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_single_item_update_validated(self):
+        line = Cart.objects.get(user=self.user, menuitem=self.menu_items[0])
+        res = self.client.put(f'{self.urls}/{line.id}', {'quantity': 'many'})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.put(f'{self.urls}/{line.id}', {'quantity': 3})
+        self.assertEqual(res.status_code, 200)
+        line.refresh_from_db()
+        self.assertEqual(float(line.price), 30)
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.revocation_cache().clear()
+        self.user = User.objects.create(username='Test_user')
+        self.category = Category.objects.create(title="Test_category", slug="test-category")
+        for i in range(15):
+            menu_item = MenuItem.objects.create(title=f"Test_menu_item{i}", price = 10 + i, category = self.category)
+            order = Order.objects.create(user=self.user, total=10)
+            OrderItem.objects.create(order=order, menuitem=menu_item, quantity=1, price=10)
+        self.factory = APIRequestFactory()
+        self.auth = {'HTTP_AUTHORIZATION': f'JWT {AccessToken.for_user(self.user)}'}
+
+    async def get(self, view, path, **extra):
+        response = await view(self.factory.get(path, **extra))
+        return response.render()
+
+    async def test_menu_items(self):
+        res = await self.get(async_views.MenuItemsView.as_view(), '/api/menu-items?ordering=-price&page=2')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['count'], 15)
+        self.assertEqual([row['title'] for row in res.data['results']], ['Test_menu_item2', 'Test_menu_item1', 'Test_menu_item0'])
+        self.assertIn('ETag', res)
+
+        res = await self.get(async_views.MenuItemsView.as_view(), '/api/menu-items?page=3')
+        self.assertEqual(res.status_code, 404)
+
+    async def test_counts(self):
+        res = await self.get(async_views.total_menu_items, '/api/menu-items/counts?page_size=5')
+        self.assertEqual(res.data['counts'], 15)
+        self.assertEqual(res.data['categories'][0]['total_pages'], 3)
+
+    async def test_orders(self):
+        res = await self.get(async_views.OrderView.as_view(), '/api/orders')
+        self.assertEqual(res.status_code, 403)
+
+        res = await self.get(async_views.OrderView.as_view(), '/api/orders', **self.auth)
+        self.assertEqual(res.data['count'], 15)
+        self.assertEqual(len(res.data['results'][0]['order_items']), 1)
+
+    async def test_writes_use_sync_view(self):
+        request = self.factory.post('/api/orders', **self.auth)
+        res = await async_views.OrderView.as_view()(request)
+        self.assertEqual(res.data['message'], 'Cart is empty')
+
+    def test_view_without_aget(self):
+        with self.assertRaises(TypeError):
+            class View(async_views.AsyncAPIView):
+                view_class = async_views.views.OrderView
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.category = Category.objects.create(title="Test_category", slug="test-category")
+        MenuItem.objects.create(title="Test_menu_item", price = 10, category = self.category)
+        self.client = APIClient()
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('menu_items'))
+        res = self.client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, 200)
+        body = res.content.decode()
+        self.assertIn('simplehub_request_duration_seconds_bucket{method="GET",route="menu_items",status="200",le="+Inf"}', body)
+        self.assertIn('simplehub_request_db_queries_sum{method="GET",route="menu_items"} 2\n', body)
+        self.assertIn('simplehub_request_serializer_seconds_total{method="GET",route="menu_items"}', body)
+        self.assertIn('simplehub_response_size_bytes_count{method="GET",route="menu_items"}', body)
+
+    def test_metrics_token(self):
+        with override_settings(METRICS={**settings.METRICS, 'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            res = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(res.status_code, 200)
+
+    async def test_async_requests(self):
+        async def view(request):
+            await Category.objects.acount()
+            return HttpResponse(b'ok')
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        res = await middleware(AsyncRequestFactory().get('/api/menu-items'))
+        self.assertEqual(res.content, b'ok')
+        self.assertIn('simplehub_request_db_queries_sum{method="GET",route="unmatched"} 1\n', metrics.registry.render())
+        self.assertIsNone(metrics.current_stats.get())
+
+    def test_slow_request_log(self):
+        with override_settings(METRICS={**settings.METRICS, 'SLOW_REQUEST_MS': 0, 'SLOW_REQUEST_SAMPLE_RATE': 1}):
+            with self.assertLogs('api.slow_requests', level='WARNING') as logs:
+                self.client.get(reverse('menu_items'))
+        self.assertIn('2 queries', logs.output[0])
+        self.assertIn('SELECT', logs.output[1])
+
+class LoadTestTestCase(TestCase):
+    def test_request_mix_in_process(self):
+        cache.clear()
+        authentication.revocation_cache().clear()
+        seed(categories=2, menu_items=30, users=4, delivery_crew=2, carts=2, orders=20)
+        customers = User.objects.filter(groups=None)
+        crew = User.objects.filter(groups__name='delivery_crew')
+        calls = loadtest.request_mix(
+            60,
+            list(MenuItem.objects.values_list('id', flat=True)),
+            list(Category.objects.values_list('title', flat=True)),
+            [str(AccessToken.for_user(user)) for user in customers],
+            [str(AccessToken.for_user(user)) for user in crew])
+        self.assertEqual(len(calls), 60)
+        self.assertEqual({call.scenario for call in calls}, {'browse', 'checkout', 'crew'})
+
+        report = loadtest.run_in_process(calls)
+        self.assertEqual(report['all']['requests'], 60)
+        self.assertEqual(report['all']['errors'], 0)
+        self.assertGreater(report['crew']['queries_per_request'], 0)
+        self.assertTrue(Order.objects.filter(user__in=customers).count() > 20)
+
+class MenuImportExportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Test_manager')
+        self.user.groups.create(name='manager')
+        self.category = Category.objects.create(title="Starters", slug="starters")
+        MenuItem.objects.create(title="Soup", price = 5, category = self.category)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def csv_file(self, rows, name='menu.csv'):
+        lines = ['title,price,featured,category,description'] + rows
+        return SimpleUploadedFile(name, '\n'.join(lines).encode())
+
+    def test_import_csv(self):
+        res = self.client.post(reverse('menu_items_import'), {'file': self.csv_file([
+            'Soup,6.50,true,starters,Hot',
+            'Steak,25,false,mains,',
+            'Broken,not-a-price,false,mains,',
+        ])})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((res.data['created'], res.data['updated'], res.data['error_count']), (1, 1, 1))
+        self.assertEqual(res.data['errors'][0]['line'], 4)
+        self.assertEqual(float(MenuItem.objects.get(title='Soup').price), 6.5)
+        self.assertEqual(MenuItem.objects.get(title='Steak').category.slug, 'mains')
+        self.assertEqual(MenuItemCount.objects.get(category__slug='mains').count, 1)
+
+    def test_import_category_title_taken(self):
+        report = bulk_io.import_menu_items(io.StringIO(
+            'title,price,featured,category,category_title,description\n'
+            'Bread,3,false,bread,Starters,\n'
+            'Steak,25,false,mains,Mains,\n'), 'csv')
+        self.assertEqual((report['created'], report['error_count']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 2)
+        self.assertFalse(Category.objects.filter(slug='bread').exists())
+
+    def test_import_failure_keeps_counts(self):
+        rows = 'title,price,featured,category,description\nSalad,7,false,starters,\nBroken'
+        original = bulk_io.resolve_categories
+        def resolve(rows, category_ids):
+            if category_ids:
+                raise RuntimeError
+            original(rows, category_ids)
+        with patch.object(bulk_io, 'resolve_categories', resolve), self.assertRaises(RuntimeError):
+            bulk_io.import_menu_items(io.StringIO(rows + ',1,false,mains,\n'), 'csv', chunk_size=1)
+        self.assertEqual(MenuItemCount.objects.get(category=self.category).count, 2)
+
+    def test_import_queries_do_not_grow_with_rows(self):
+        def import_rows(n, offset):
+            rows = [f'Item{i},10,false,category{i % 5 + offset},' for i in range(offset, offset + n)]
+            with CaptureQueriesContext(connection) as queries:
+                bulk_io.import_menu_items(io.StringIO('\n'.join(['title,price,featured,category,description'] + rows)), 'csv')
+            return len(queries)
+        self.assertEqual(import_rows(10, 0), import_rows(150, 1000))
+
+    def test_import_jsonl_and_permissions(self):
+        upload = SimpleUploadedFile('menu.jsonl', b'{"title": "Salad", "price": "7.00", "category": "starters"}\nnot json\n')
+        res = self.client.post(reverse('menu_items_import'), {'file': upload})
+        self.assertEqual((res.data['created'], res.data['error_count']), (1, 1))
+
+        self.client.force_authenticate(user=User.objects.create(username='Test_user'))
+        res = self.client.post(reverse('menu_items_import'), {'file': self.csv_file([])})
+        self.assertEqual(res.status_code, 403)
+
+    def test_export_round_trip(self):
+        res = self.client.get(reverse('menu_items_export'))
+        body = b''.join(res.streaming_content).decode()
+        self.assertEqual(body.splitlines(), ['title,price,featured,category,description', 'Soup,5.00,False,starters,'])
+
+        res = self.client.get(reverse('menu_items_export'), {'file_format': 'jsonl'})
+        row = json.loads(b''.join(res.streaming_content))
+        self.assertEqual(row, {'title': 'Soup', 'price': '5.00', 'featured': False, 'category': 'starters', 'description': None})
+
+        MenuItem.objects.all().delete()
+        report = bulk_io.import_menu_items(io.StringIO(body), 'csv')
+        self.assertEqual(report['created'], 1)
+
+
+class OrderExportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create(username='Test_manager')
+        self.manager.groups.create(name='manager')
+        self.crew = User.objects.create(username='Test_crew')
+        self.user = User.objects.create(username='Test_user')
+        category = Category.objects.create(title="Starters", slug="starters")
+        soup = MenuItem.objects.create(title="Soup", price = 5, category = category)
+        salad = MenuItem.objects.create(title="Salad", price = 7, category = category)
+        self.delivered = Order.objects.create(user=self.user, delivery_crew=self.crew, status=True, total=17, date=date(2024, 1, 2))
+        OrderItem.objects.create(order=self.delivered, menuitem=soup, quantity=2, price=10)
+        OrderItem.objects.create(order=self.delivered, menuitem=salad, quantity=1, price=7)
+        self.pending = Order.objects.create(user=self.user, total=5, date=date(2024, 2, 1))
+        OrderItem.objects.create(order=self.pending, menuitem=soup, quantity=1, price=5)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def export(self, **params):
+        res = self.client.get(reverse('orders_export'), params)
+        self.assertEqual(res.status_code, 200)
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_csv(self):
+        lines = self.export().splitlines()
+        self.assertEqual(lines[0], 'order,user,delivery_crew,status,date,total,menuitem,title,quantity,price')
+        soup, salad = MenuItem.objects.get(title='Soup').id, MenuItem.objects.get(title='Salad').id
+        self.assertEqual(lines[1:], [
+            f'{self.delivered.id},{self.user.id},{self.crew.id},True,2024-01-02,17.00,{soup},Soup,2,10.00',
+            f'{self.delivered.id},{self.user.id},{self.crew.id},True,2024-01-02,17.00,{salad},Salad,1,7.00',
+            f'{self.pending.id},{self.user.id},,False,2024-02-01,5.00,{soup},Soup,1,5.00',
+        ])
+
+    def test_export_jsonl_groups_items(self):
+        orders = [json.loads(line) for line in self.export(file_format='jsonl').splitlines()]
+        self.assertEqual([order['order'] for order in orders], [self.delivered.id, self.pending.id])
+        self.assertEqual([item['title'] for item in orders[0]['items']], ['Soup', 'Salad'])
+        self.assertEqual(orders[1]['delivery_crew'], None)
+        self.assertEqual(orders[1]['total'], '5.00')
+
+    @override_settings(THROTTLING={**settings.THROTTLING, 'ENABLED': False})
+    def test_export_filters(self):
+        def exported(**params):
+            return [json.loads(line)['order'] for line in self.export(file_format='jsonl', **params).splitlines()]
+        self.assertEqual(exported(start='2024-01-15'), [self.pending.id])
+        self.assertEqual(exported(end='2024-01-15'), [self.delivered.id])
+        self.assertEqual(exported(status='false'), [self.pending.id])
+        self.assertEqual(exported(delivery_crew=self.crew.id), [self.delivered.id])
+
+        res = self.client.get(reverse('orders_export'), {'start': '2024-02-01', 'end': '2024-01-01'})
+        self.assertEqual(res.status_code, 400)
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(reverse('orders_export')).status_code, 403)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.jsonl')
+            call_command('export_orders', '--format', 'jsonl', '--status', 'delivered', '--output', path)
+            with open(path) as output:
+                self.assertEqual([json.loads(line)['order'] for line in output], [self.delivered.id])
@@ -0,0 +1,109 @@
+import math
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from rest_framework.throttling import BaseThrottle
+from . import metrics
+from .middleware import match_name, route_name
+
+
+def route_budget(route):
+    return settings.THROTTLING['ROUTES'].get(route, settings.THROTTLING['DEFAULT'])
+
+
+class TokenBucketThrottle(BaseThrottle):
+    # Two token buckets per client, one for the route and one across all
+    # routes, kept in the shared cache. A budget is (tokens refilled per
+    # second, bucket size). Concurrent requests of one client can race on
+    # the read-modify-write and let a request or two more through.
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not settings.THROTTLING['ENABLED']:
+            return True
+
+        route = route_name(request)
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        budgets = {
+            f'throttle:{route}:{ident}': route_budget(route),
+            f'throttle:*:{ident}': settings.THROTTLING['USER'],
+        }
+
+        now = time.time()
+        states = cache.get_many(list(budgets))
+        buckets, wait = {}, 0
+        for key, (rate, burst) in budgets.items():
+            tokens, stamp = states.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+            buckets[key] = tokens
+
+        allowed = wait == 0
+        if allowed:
+            buckets = {key: tokens - 1 for key, tokens in buckets.items()}
+        else:
+            self.wait_seconds = wait
+        timeout = max(math.ceil(burst / rate) for rate, burst in budgets.values()) + 1
+        cache.set_many({key: (tokens, now) for key, tokens in buckets.items()}, timeout)
+        metrics.throttle_decisions.inc(route=route, decision='allowed' if allowed else 'throttled')
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AdmissionControlMiddleware:
+    # Sheds load with 503 once MAX_IN_FLIGHT requests are being served by
+    # this worker process, instead of queueing them behind the busy ones.
+    # Slots are only ever taken without blocking, so the same semaphore
+    # serves threads and the event loop.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slots = threading.BoundedSemaphore(settings.THROTTLING['MAX_IN_FLIGHT'])
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.exempt(request):
+            return self.get_response(request)
+        if not self.slots.acquire(blocking=False):
+            return self.shed(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
+
+    async def __acall__(self, request):
+        if self.exempt(request):
+            return await self.get_response(request)
+        if not self.slots.acquire(blocking=False):
+            return self.shed(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.slots.release()
+
+    def exempt(self, request):
+        return not settings.THROTTLING['ENABLED'] or request.path_info in settings.THROTTLING['EXEMPT_PATHS']
+
+    def shed(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            match = None
+        metrics.shed_requests.inc(route=match_name(match))
+        response = JsonResponse({"detail": "Too many requests in flight, retry shortly"}, status=503)
+        response['Retry-After'] = str(settings.THROTTLING['SHED_RETRY_AFTER'])
+        return response
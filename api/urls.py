@@ -1,18 +1,39 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+if settings.ASYNC_READ_VIEWS:
+    categories_view = async_views.CategoriesView.as_view()
+    menu_items_view = async_views.MenuItemsView.as_view()
+    menu_items_counts_view = async_views.total_menu_items
+    orders_view = async_views.OrderView.as_view()
+else:
+    categories_view = views.CategoriesView.as_view()
+    menu_items_view = views.MenuItemsView.as_view()
+    menu_items_counts_view = views.total_menu_items
+    orders_view = views.OrderView.as_view()
 
 urlpatterns = [
-    path('categories', views.CategoriesView.as_view(), name='categories'),
-    path('categories/<int:pk>', views.SingleCategoryView.as_view()),
-    path('menu-items', views.MenuItemsView.as_view(), name='menu_items'),
-    path('menu-items/<int:pk>', views.SingleMenuItemView.as_view()),
-    path('menu-items/counts', views.total_menu_items, name='menu_items_counts'),
-    path('cart/menu-items', views.CartView.as_view()),
-    path('cart/menu-items/<int:pk>', views.SingleCartItemView.as_view()),
-    path('orders', views.OrderView.as_view()),
-    path('orders/<int:pk>', views.SingleOrderView.as_view()),
+    path('categories', categories_view, name='categories'),
+    path('categories/<int:pk>', views.SingleCategoryView.as_view(), name='category'),
+    path('menu-items', menu_items_view, name='menu_items'),
+    path('menu-items/<int:pk>', views.SingleMenuItemView.as_view(), name='menu_item'),
+    path('menu-items/search', views.MenuSearchView.as_view(), name='menu_items_search'),
+    path('menu-items/counts', menu_items_counts_view, name='menu_items_counts'),
+    path('menu-items/import', views.import_menu_items, name='menu_items_import'),
+    path('menu-items/export', views.export_menu_items, name='menu_items_export'),
+    path('cart/menu-items', views.CartView.as_view(), name='cart'),
+    path('cart/menu-items/<int:pk>', views.SingleCartItemView.as_view(), name='cart_item'),
+    path('orders', orders_view, name='orders'),
+    path('orders/<int:pk>', views.SingleOrderView.as_view(), name='order'),
+    path('orders/changes', views.order_changes, name='order_changes'),
+    path('orders/export', views.export_orders, name='orders_export'),
+    path('orders/batch', views.update_orders, name='orders_batch'),
+    path('reports/revenue', views.revenue_report, name='revenue_report'),
+    path('reports/top-menu-items', views.top_menu_items_report, name='top_menu_items_report'),
+    path('reports/crew-deliveries', views.crew_deliveries_report, name='crew_deliveries_report'),
     path('groups/manager/users', views.ManagerViewSet.as_view(
-        {'get': 'list', 'post': 'create', 'delete': 'destroy'})),
+        {'get': 'list', 'post': 'create', 'delete': 'destroy'}), name='manager_users'),
     path('groups/delivery-crew/users', views.DeliveryCrewViewSet.as_view(
-        {'get': 'list', 'post': 'create', 'delete': 'destroy'}))
-]
\ No newline at end of file
+        {'get': 'list', 'post': 'create', 'delete': 'destroy'}), name='delivery_crew_users'),
+]
@@ -1,4 +1,11 @@
 import math
 
 def calc_pages(n, p):
-    return math.ceil(n / p)
\ No newline at end of file
+    return math.ceil(n / p)
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1)
+    return values[max(index, 0)]
@@ -1,19 +1,48 @@
+import io
+from datetime import date, timedelta
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, SAFE_METHODS
 from rest_framework import generics, viewsets, status
 from rest_framework.response import Response
-from .models import Category, MenuItem, Cart, Order, OrderItem
+from rest_framework.exceptions import ValidationError
+from .models import Category, MenuItem, MenuItemCount, Cart, Order, OrderEvent, ArchivedOrder
 from django.contrib.auth.models import User, Group
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from . import serializers
+from django.utils.crypto import constant_time_compare
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from . import serializers, metrics, bulk_io, reports, assignment
 from .permissions import IsManager
-from rest_framework.decorators import api_view
+from .roles import get_roles
+from rest_framework.decorators import api_view, permission_classes, parser_classes
+from rest_framework.parsers import MultiPartParser
+from rest_framework.settings import api_settings
+from rest_framework.fields import BooleanField
 from .utils import calc_pages
+from .checkout import checkout
+from .cart import update_cart
+from .catalog import catalog_cached, cached_catalog_response
+from .pagination import KeysetPagination
+from .search import search
+from .idempotency import idempotent
+from .fastpath import FastListMixin, MenuItemRows, OrderRows, ArchivedOrderRows, OrderSummaryRows
+from .changes import record_order_events, current_version, is_pruned, changes_since, UPDATED, MAX_CHANGES
 
 def check_given_permissions(self):
     permission_classes = []
     if self.request.method not in SAFE_METHODS:
         permission_classes.append(IsManager)
     return [permission() for permission in permission_classes] 
+
+class EagerLoadingViewMixin:
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
     
 class CategoriesView(generics.ListCreateAPIView):
     queryset = Category.objects.all()
@@ -22,42 +51,97 @@ class CategoriesView(generics.ListCreateAPIView):
     def get_permissions(self):
         return check_given_permissions(self)
 
+    @catalog_cached
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 class SingleCategoryView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Category.objects.all()
     serializer_class = serializers.CategorySerializer
     def get_permissions(self):
         return check_given_permissions(self)
 
-class MenuItemsView(generics.ListCreateAPIView):
+class MenuItemsView(FastListMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = serializers.MenuItemSerializer
+    fast_rows_class = MenuItemRows
     search_fields = ['category__title']
     ordering_fields = ['price']
+    pagination_class = KeysetPagination
+    cursor_ordering = ['price']
+    cursor_ordering_fields = ['price']
 
     def get_permissions(self):
         return check_given_permissions(self)
+
+    @catalog_cached
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
-class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
+class MenuSearchView(EagerLoadingViewMixin, generics.ListAPIView):
+    queryset = MenuItem.objects.all()
+    serializer_class = serializers.MenuItemSerializer
+    filter_backends = []
+
+    def get_queryset(self):
+        params = serializers.MenuSearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        queryset = super().get_queryset()
+        if params['featured'] is not None:
+            queryset = queryset.filter(featured=params['featured'])
+        if 'category' in params:
+            queryset = queryset.filter(category__slug=params['category'])
+        if 'min_price' in params:
+            queryset = queryset.filter(price__gte=params['min_price'])
+        if 'max_price' in params:
+            queryset = queryset.filter(price__lte=params['max_price'])
+        return search(queryset, params['q'])
+
+    @catalog_cached
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+class SingleMenuItemView(EagerLoadingViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = serializers.MenuItemSerializer
 
     def get_permissions(self):
         return check_given_permissions(self)
+
+    @catalog_cached
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
-class CartView(generics.ListCreateAPIView):
+class CartView(EagerLoadingViewMixin, generics.ListCreateAPIView):
     queryset = Cart.objects.all()
     serializer_class = serializers.CartSerializer
     permission_classes = [IsAuthenticated]
-    
+    pagination_class = KeysetPagination
+    cursor_ordering_fields = ['menuitem__title']
 
     def get_queryset(self):
-        return Cart.objects.filter(user = self.request.user).order_by('menuitem__title')
+        return super().get_queryset().filter(user = self.request.user).order_by('menuitem__title')
     
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return serializers.CartUserSerializer
         return serializers.CartSerializer
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotent
+    def patch(self, request, *args, **kwargs):
+        batch = serializers.CartBatchSerializer(data = request.data)
+        batch.is_valid(raise_exception=True)
+        update_cart(request.user, **batch.validated_data)
+
+        cart = serializers.CartUserSerializer.setup_eager_loading(self.get_queryset())
+        return Response(serializers.CartUserSerializer(cart, many=True).data, status=status.HTTP_200_OK)
+
+    @idempotent
     def delete(self, request, *args, **kwargs):
         Cart.objects.filter(user = request.user).delete()
         return Response({"message": "deleted cart"}, status=status.HTTP_204_NO_CONTENT)
@@ -70,92 +154,160 @@ class SingleCartItemView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Cart.objects.filter(user = self.request.user)
     
+    @idempotent
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
-        quantity = request.data.get('quantity')
-        instance.quantity = quantity
-        instance.price = instance.unit_price * int(quantity)
+        serializer = serializers.CartQuantitySerializer(data = request.data, context={'unit_price': instance.unit_price})
+        serializer.is_valid(raise_exception=True)
+        instance.quantity = serializer.validated_data['quantity']
+        instance.price = serializer.validated_data['price']
         instance.save()
         return Response({"message": "Order updated"}, status=status.HTTP_200_OK)
+
+    @idempotent
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
                                                                                                                                                                             
-class OrderView(generics.ListCreateAPIView):
+def include_archived(request):
+    value = request.query_params.get('include_archived')
+    return value is not None and BooleanField().to_internal_value(value or 'true')
+
+def filter_for_roles(request, queryset):
+    # Works on orders and order events, both have user and delivery_crew
+    roles = get_roles(request)
+    if not roles:
+        return queryset.filter(user = request.user)
+    elif 'delivery_crew' in roles:
+        return queryset.filter(delivery_crew = request.user)
+    else:
+        return queryset
+
+class OrderView(FastListMixin, EagerLoadingViewMixin, generics.ListCreateAPIView):
     queryset = Order.objects.all()
     serializer_class = serializers.OrderSerializer
+    fast_rows_class = OrderRows
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_ordering = ['-date']
+    cursor_ordering_fields = ['date', 'total']
 
     def get_queryset(self):
-        if self.request.user.groups.count() == 0:
-            return Order.objects.filter(user = self.request.user)
-        elif self.request.user.groups.filter(name = 'delivery_crew').exists():
-            return Order.objects.filter(delivery_crew = self.request.user)
-        else:
-            return Order.objects.all()
+        return filter_for_roles(self.request, super().get_queryset())
 
+    def get_serializer_class(self):
+        if self.request.method in SAFE_METHODS and self.request.query_params.get('view') == 'summary':
+            return serializers.OrderSummarySerializer
+        return super().get_serializer_class()
+
+    def include_archived(self):
+        return include_archived(self.request)
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+        # Archived orders only come through this explicit, slower path: a
+        # UNION of both tables, newest first, with page numbers
+        if self.paginator.cursor_query_param in request.query_params:
+            raise ValidationError({"message": "include_archived does not support cursor pagination"})
+        rows_class = OrderSummaryRows if self.get_serializer_class() is serializers.OrderSummarySerializer else ArchivedOrderRows
+        orders = filter_for_roles(request, Order.objects.all()).values(*rows_class.values)
+        archived = filter_for_roles(request, ArchivedOrder.objects.all()).values(*rows_class.values)
+        queryset = orders.union(archived, all=True).order_by('-date', '-id')
+        page = self.paginate_queryset(queryset)
+        with metrics.time_serializer():
+            return self.get_paginated_response(rows_class().build(page))
+
+    @idempotent
     def create(self, request, *args, **kwargs):
-        menuitem_count = Cart.objects.filter(user = request.user).count()
-        if menuitem_count == 0:
+        order_serializer = serializers.OrderSerializer(data = request.data)
+        order_serializer.is_valid(raise_exception=True)
+
+        order = checkout(request.user, **order_serializer.validated_data)
+        if order is None:
             return Response({"message":'Cart is empty'})
-        data = request.data.copy()
-        total = self.get_total_price(request.user)
-        data['total'] = total
-        data['user'] = request.user.id
-        
-        order_serializer = serializers.OrderSerializer(data = data)
-        
-        if order_serializer.is_valid(raise_exception=True):
-            order = order_serializer.save()
-
-            items = Cart.objects.all().filter(user=self.request.user).all()
-            for item in items.values():
-                orderitem = OrderItem(
-                    order=order,
-                    menuitem_id=item['menuitem_id'],
-                    price=item['price'],
-                    quantity=item['quantity'],
-                )
-                orderitem.save()
-            Cart.objects.all().filter(user=self.request.user).delete()
-            return Response(order_serializer.data, status=status.HTTP_201_CREATED)
-        
-    def get_total_price(self, user):
-        total = 0
-        items = Cart.objects.all().filter(user=user).all()
-        for item in items.values():
-            total += item['price']
-        return total
+        return Response(serializers.OrderSerializer(order).data, status=status.HTTP_201_CREATED)
     
-class SingleOrderView(generics.RetrieveUpdateAPIView):
+class SingleOrderView(EagerLoadingViewMixin, generics.RetrieveUpdateAPIView):
     queryset = Order.objects.all()
     serializer_class = serializers.OrderUpdateSerializer
     permission_classes = [IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if not include_archived(request):
+                raise
+        # Archived orders are read only, in the same shape
+        archived = filter_for_roles(request, ArchivedOrder.objects.filter(pk=kwargs['pk']))
+        rows = ArchivedOrderRows().build(list(archived.values(*ArchivedOrderRows.values)))
+        if not rows:
+            raise Http404
+        order = rows[0]
+        order['orderitem'] = order.pop('order_items')
+        return Response(order)
     
     def update(self, request, *args, **kwargs):
-        if request.user.groups.count() == 0:
+        roles = get_roles(request)
+        if not roles:
             return Response({"message": "Not Authorized"}, status=status.HTTP_403_FORBIDDEN)
         
         instance = self.get_object()
-        if request.user.groups.filter(name="delivery_crew").exists():
+        if 'delivery_crew' in roles:
             state = request.data.get("status")
             if state is not None:
-                instance.status = state
-                instance.save()
+                instance.status = BooleanField().to_internal_value(state)
+                self.save_order(instance, ['status'])
                 return Response({"message": "Order status updated"}, status=status.HTTP_200_OK)
             else:
                 return Response({"message": "Status not provided"}, status=status.HTTP_400_BAD_REQUEST)
-        elif request.user.groups.filter(name="manager").exists():
+        elif 'manager' in roles:
             delivery_crew_id = request.data.get('delivery_crew')
             state = request.data.get("status")
             if delivery_crew_id is not None:
                 delivery_crew = get_object_or_404(User, id=delivery_crew_id)
                 instance.delivery_crew = delivery_crew
             if state is not None:
-                instance.status = state
+                instance.status = BooleanField().to_internal_value(state)
 
-            instance.save()
+            self.save_order(instance, ['delivery_crew', 'status'])
             return Response({"message": "Order updated"}, status=status.HTTP_200_OK)
         else:
             return Response({"message": "Not Authorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    def save_order(self, instance, fields):
+        # Lock the row to see what changed, then keep the change feed and
+        # the delivery rollups in step with the order
+        with transaction.atomic():
+            was_delivered, previous_crew_id = (
+                Order.objects.select_for_update().filter(pk=instance.pk)
+                .values_list('status', 'delivery_crew_id').get())
+            instance.save(update_fields=fields)
+            record_order_events([instance], UPDATED, {instance.pk: previous_crew_id})
+            reports.record_delivery(instance, was_delivered, previous_crew_id)
             
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def update_orders(request):
+    # Managers assign crew and set status, crew members only set the
+    # status of their own orders
+    roles = get_roles(request)
+    if 'manager' not in roles and 'delivery_crew' not in roles:
+        return Response({"message": "Not Authorized"}, status=status.HTTP_403_FORBIDDEN)
+    params = serializers.OrderBatchUpdateSerializer(data=request.data)
+    params.is_valid(raise_exception=True)
+    params = params.validated_data
+    if 'manager' not in roles and 'delivery_crew' in params:
+        return Response({"message": "Not Authorized"}, status=status.HTTP_403_FORBIDDEN)
+
+    changes = {}
+    if 'delivery_crew' in params:
+        changes['delivery_crew_id'] = params['delivery_crew']
+    if 'status' in params:
+        changes['status'] = params['status']
+    results = assignment.update_orders(filter_for_roles(request, Order.objects.all()), params['orders'], **changes)
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
 class ManagerViewSet(viewsets.ViewSet): 
     permission_classes = [IsAdminUser]
     def list(self, request):
@@ -184,7 +336,7 @@ class DeliveryCrewViewSet(viewsets.ViewSet):
 
     def create(self, request):
         if self.request.user.is_superuser == False:
-            if self.request.user.groups.filter(name='Manager').exists() == False:
+            if 'Manager' not in get_roles(request):
                 return Response({"message":"forbidden"}, status=status.HTTP_403_FORBIDDEN)
         
         user = get_object_or_404(User, username=request.data['username'])
@@ -194,7 +346,7 @@ class DeliveryCrewViewSet(viewsets.ViewSet):
 
     def destroy(self, request):
         if self.request.user.is_superuser == False:
-            if self.request.user.groups.filter(name='Manager').exists() == False:
+            if 'Manager' not in get_roles(request):
                 return Response({"message":"forbidden"}, status.HTTP_403_FORBIDDEN)
 
         user = get_object_or_404(User, username=request.data['username'])
@@ -205,13 +357,143 @@ class DeliveryCrewViewSet(viewsets.ViewSet):
 
 @api_view(['GET'])
 def total_menu_items(request):
-    if request.method == 'GET':
-        search_slug = request.query_params.get('category')
-        if search_slug is not None:
-            menuitem_count = MenuItem.objects.filter(category__slug=search_slug).count()
-            total_pages = calc_pages(menuitem_count, 12)
-            return Response({"counts": menuitem_count, "total_pages": total_pages}, status=status.HTTP_200_OK)
-        else:
-            menuitem_count = MenuItem.objects.all().count()
-            total_pages = calc_pages(menuitem_count, 12)
-            return Response({"counts": menuitem_count, "total_pages": total_pages}, status=status.HTTP_200_OK)
\ No newline at end of file
+    return cached_catalog_response(request, lambda: menu_item_counts(request))
+
+def get_counts_page_size(request):
+    try:
+        page_size = int(request.query_params.get('page_size', api_settings.PAGE_SIZE))
+        if page_size < 1:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({"message": "page_size must be a positive integer"})
+    return page_size
+
+def counts_response(menuitem_count, page_size, categories=None):
+    data = {"counts": menuitem_count, "total_pages": calc_pages(menuitem_count, page_size)}
+    if categories is not None:
+        data["categories"] = [
+            {**category, "total_pages": calc_pages(category["counts"], page_size)}
+            for category in categories
+        ]
+    return Response(data, status=status.HTTP_200_OK)
+
+def category_counts():
+    return Category.objects.values('id', 'title', 'slug', counts=Coalesce(F('menu_item_count__count'), 0))
+
+def menu_item_counts(request):
+    page_size = get_counts_page_size(request)
+    search_slug = request.query_params.get('category')
+    if search_slug is not None:
+        menuitem_count = MenuItemCount.objects.filter(category__slug=search_slug).values_list('count', flat=True).first() or 0
+        return counts_response(menuitem_count, page_size)
+    else:
+        categories = list(category_counts())
+        return counts_response(sum(category["counts"] for category in categories), page_size, categories)
+
+@api_view(['POST'])
+@permission_classes([IsManager])
+@parser_classes([MultiPartParser])
+def import_menu_items(request):
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"message": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+    format = request.query_params.get('file_format') or bulk_io.file_format(upload.name)
+    if format not in ('csv', 'jsonl'):
+        return Response({"message": "file_format must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+    report = bulk_io.import_menu_items(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''), format)
+    return Response(report, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def export_menu_items(request):
+    format = request.query_params.get('file_format', 'csv')
+    if format not in ('csv', 'jsonl'):
+        return Response({"message": "file_format must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(bulk_io.export_menu_items(format), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="menu-items.{format}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def export_orders(request):
+    params = serializers.OrderExportSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    filters = dict(params.validated_data)
+    format = filters.pop('file_format')
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(bulk_io.export_orders(format, **filters), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="orders.{format}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def order_changes(request):
+    since = request.query_params.get('since')
+    if since is None:
+        return Response({"version": current_version(), "has_more": False, "results": [], "removed": []})
+    try:
+        since = int(since)
+        limit = int(request.query_params.get('limit', MAX_CHANGES))
+        if since < 0 or not 0 < limit <= MAX_CHANGES:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({"message": f"since must be a version and limit between 1 and {MAX_CHANGES}"})
+    if is_pruned(since):
+        return Response({"message": "since is too old, fetch /api/orders again"}, status=status.HTTP_410_GONE)
+
+    events = filter_for_roles(request, OrderEvent.objects.all())
+    orders = filter_for_roles(request, Order.objects.all())
+    changes = changes_since(events, orders, since, limit)
+    return Response({
+        "version": changes['version'],
+        "has_more": changes['has_more'],
+        "results": serializers.OrderSummarySerializer(changes['orders'], many=True).data,
+        "removed": changes['removed'],
+    })
+
+def get_report_range(request):
+    # Inclusive date range, the last 30 days by default
+    start = request.query_params.get('start')
+    end = request.query_params.get('end')
+    try:
+        end = date.fromisoformat(end) if end else date.today()
+        start = date.fromisoformat(start) if start else end - timedelta(days=29)
+    except ValueError:
+        raise ValidationError({"message": "start and end must be dates formatted YYYY-MM-DD"})
+    if start > end:
+        raise ValidationError({"message": "start must not be after end"})
+    return start, end
+
+def report_response(start, end, results):
+    return Response({"start": start, "end": end, "results": list(results)}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def revenue_report(request):
+    start, end = get_report_range(request)
+    return report_response(start, end, reports.revenue_by_day(start, end))
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def top_menu_items_report(request):
+    start, end = get_report_range(request)
+    try:
+        limit = int(request.query_params.get('limit', 10))
+        if not 0 < limit <= 100:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({"message": "limit must be between 1 and 100"})
+    return report_response(start, end, reports.top_menu_items(start, end, limit))
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def crew_deliveries_report(request):
+    start, end = get_report_range(request)
+    return report_response(start, end, reports.crew_deliveries(start, end))
+
+def metrics_view(request):
+    token = settings.METRICS['TOKEN']
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4')
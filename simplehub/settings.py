@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.throttling.AdmissionControlMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,17 +80,87 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'simplehub.wsgi.application'
 
+# Serve catalog and order list GETs from the async views in api/async_views.py,
+# for deployments running simplehub.asgi under uvicorn
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+
+# Build menu item and order list pages from values() rows instead of the
+# serializers, rendered with orjson when installed (api/fastpath.py)
+FAST_LIST_RENDERING = os.environ.get('FAST_LIST_RENDERING') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+def conn_max_age(value):
+    # An empty value or "none" means unlimited persistent connections
+    return None if value.strip().lower() in ('', 'none') else int(value)
+
+def database(**overrides):
+    config = {
+        'ENGINE': os.environ.get('DATABASE_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+        'HOST': os.environ.get('DATABASE_HOST', ''),
+        'PORT': os.environ.get('DATABASE_PORT', ''),
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        # Seconds to keep a connection open for reuse by later requests (0
+        # closes it after every request, None never does). Reused connections
+        # are checked before each request.
+        'CONN_MAX_AGE': conn_max_age(os.environ.get('DATABASE_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    config.update(overrides)
+    return config
+
 DATABASES = {
+    'default': database(),
+}
+
+# Read replicas as comma separated hosts, or database files for SQLite. Safe
+# method requests read from them, see api/routers.py
+for i, location in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    location_key = 'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST'
+    DATABASES[f'replica{i}'] = database(**{location_key: location.strip()}, TEST={'MIRROR': 'default'})
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they changed something
+REPLICA_READ_YOUR_WRITES_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # JWT revocations (api/authentication.py). It must be shared by all
+    # workers and must not evict keys, so stateless JWT routes are only
+    # enabled when it is Redis with maxmemory-policy noeviction.
+    'revocation': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'revocation',
+    },
 }
 
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+REVOCATION_REDIS_URL = os.environ.get('REVOCATION_REDIS_URL', os.environ.get('REDIS_URL'))
+
+if REVOCATION_REDIS_URL:
+    CACHES['revocation'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REVOCATION_REDIS_URL,
+        'KEY_PREFIX': 'revocation',
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -136,8 +210,11 @@ REST_FRAMEWORK = {
    ],
    'DEFAULT_AUTHENTICATION_CLASSES': (
        'rest_framework.authentication.SessionAuthentication',
-       'rest_framework_simplejwt.authentication.JWTAuthentication',
+       'api.authentication.JWTAuthentication',
    ),
+   'DEFAULT_THROTTLE_CLASSES': [
+       'api.throttling.TokenBucketThrottle',
+   ],
    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
    'PAGE_SIZE': 12,
 }
@@ -150,8 +227,80 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT',),
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.RoleTokenObtainPairSerializer',
 }
 
+# Seconds a response stored for an Idempotency-Key is replayed to retries,
+# expired ones are removed by the prune_idempotency_keys command
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Change feed events newer than this are sent again on every poll, covering
+# transactions that committed out of id order. Keep it above the longest
+# order write transaction.
+ORDER_CHANGES_LOOKBACK_SECONDS = 30
+
+# Delivered orders older than this many days are moved to the archive tables
+# by the archive_orders command
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 180))
+
+# Routes (url names from api/urls.py) where a valid, unrevoked JWT is trusted
+# as is: the user is built from its claims without a database lookup. Admin,
+# session and group management flows keep loading the user. Only enabled
+# when CACHES['revocation'] is shared.
+STATELESS_JWT_ROUTES = set()
+
+if REVOCATION_REDIS_URL:
+    STATELESS_JWT_ROUTES = {
+        'categories', 'menu_items', 'menu_item', 'menu_items_counts', 'menu_items_search',
+        'cart', 'cart_item', 'orders', 'order', 'order_changes',
+    }
+
+# Trust the roles claim of JWTs instead of looking up the user's groups
+ROLES_FROM_TOKEN = False
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000'
-]
\ No newline at end of file
+]
+
+# Per-route request metrics served at /metrics, see api/middleware.py
+METRICS = {
+    'ENABLED': True,
+    # Require 'Authorization: Bearer <token>' on /metrics when set
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_REQUEST_SAMPLE_RATE': 0.1,
+}
+
+THROTTLING = {
+    'ENABLED': os.environ.get('THROTTLING', '1') == '1',
+    # (tokens refilled per second, bucket size) per user, or client IP for
+    # anonymous requests, and route name from api/urls.py
+    'DEFAULT': (10, 60),
+    'ROUTES': {
+        'orders': (2, 20),
+        'order_changes': (1, 10),
+        'menu_items_counts': (2, 20),
+        'menu_items_search': (5, 30),
+        'menu_items_import': (0.1, 2),
+        'menu_items_export': (0.1, 2),
+        'orders_export': (0.1, 2),
+        'orders_batch': (1, 10),
+    },
+    # Budget of each client across all routes
+    'USER': (20, 120),
+    # Requests served at once by one worker process before shedding with 503
+    'MAX_IN_FLIGHT': 64,
+    'SHED_RETRY_AFTER': 1,
+    'EXEMPT_PATHS': ['/metrics'],
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.slow_requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}